@@ -0,0 +1,152 @@
+"""
+Benchmark batch searches against sequential single requests.
+
+Usage::
+
+    python benchmarks/bench_batch.py [--queries 100] [--distinct 60] [--latency 0.02]
+
+Runs the same list of CQL queries (with some duplicates, as in real tool
+workloads) through the full app against a local Korp stand-in:
+
+1. "sequential": one ``searchRetrieve`` request per query,
+2. "batch": a single ``POST /batch`` request, with different numbers of
+   parallel Korp queries (``batchMaxWorkers``).
+
+Result sets are disabled, so repeated queries are not served from memory.
+Reports wall time, throughput, time to the first result line and the
+number of Korp calls.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from korp_stub import KorpStubServer  # noqa: E402
+from werkzeug.test import Client  # noqa: E402
+
+from korp_endpoint.app import make_app  # noqa: E402
+from korp_endpoint.endpoint import API_BASE_URL_KEY  # noqa: E402
+from korp_endpoint.endpoint import RESULT_SET_TTL_KEY  # noqa: E402
+from korp_endpoint.wsgi import BATCH_MAX_QUERIES_KEY  # noqa: E402
+from korp_endpoint.wsgi import BATCH_MAX_WORKERS_KEY  # noqa: E402
+
+# ---------------------------------------------------------------------------
+
+
+WORKERS = [1, 4, 8, 16]
+RECORDS = 10
+
+
+def make_queries(count: int, distinct: int):
+    rng = random.Random(1)
+    words = [f"ord{i}" for i in range(distinct)]
+    # all distinct words at least once, the rest repeated
+    queries = words + [rng.choice(words) for _ in range(max(0, count - distinct))]
+    rng.shuffle(queries)
+    return queries[:count]
+
+
+def korp_calls(server, before: int) -> int:
+    return sum(
+        1 for params in server.requests[before:] if params.get("command") == ["query"]
+    )
+
+
+def run_sequential(app, queries):
+    client = Client(app)
+    start = time.perf_counter()
+    first = None
+    for query in queries:
+        url = (
+            f"/?operation=searchRetrieve&maximumRecords={RECORDS}&query={quote(query)}"
+        )
+        resp = client.get(url)
+        assert resp.status_code == 200 and b"<fcs:Resource" in resp.data
+        if first is None:
+            first = time.perf_counter() - start
+    return time.perf_counter() - start, first
+
+
+def run_batch(app, queries):
+    client = Client(app)
+    body = json.dumps([{"query": q, "maximumRecords": RECORDS} for q in queries])
+    start = time.perf_counter()
+    resp = client.post(
+        "/batch", data=body, content_type="application/json", buffered=False
+    )
+    first = None
+    lines = 0
+    buffer = b""
+    for chunk in resp.iter_encoded():
+        buffer += chunk
+        while b"\n" in buffer:
+            line, buffer = buffer.split(b"\n", 1)
+            assert "records" in json.loads(line), line
+            lines += 1
+            if first is None:
+                first = time.perf_counter() - start
+    resp.close()
+    assert lines == len(queries), lines
+    return time.perf_counter() - start, first
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--distinct", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.02)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    queries = make_queries(args.queries, args.distinct)
+    server = KorpStubServer(latency=args.latency).start()
+
+    try:
+        print(
+            f"{len(queries)} queries ({len(set(queries))} distinct),"
+            f" Korp latency {args.latency * 1000:.0f} ms"
+        )
+        print(
+            f"  {'variant':<20} {'total':>9} {'queries/s':>10}"
+            f" {'first':>9} {'korp calls':>11}"
+        )
+        params = {API_BASE_URL_KEY: server.api_base_url, RESULT_SET_TTL_KEY: "0"}
+        app = make_app(params)
+
+        before = len(server.requests)
+        total, first = run_sequential(app, queries)
+        calls = korp_calls(server, before)
+        print(
+            f"  {'sequential':<20} {total:7.2f} s {len(queries) / total:10.1f}"
+            f" {first * 1000:6.1f} ms {calls:11d}"
+        )
+
+        for workers in WORKERS:
+            app = make_app(
+                {
+                    **params,
+                    BATCH_MAX_QUERIES_KEY: str(len(queries)),
+                    BATCH_MAX_WORKERS_KEY: str(workers),
+                }
+            )
+            before = len(server.requests)
+            total, first = run_batch(app, queries)
+            calls = korp_calls(server, before)
+            label = f"batch, {workers} workers"
+            print(
+                f"  {label:<20} {total:7.2f} s {len(queries) / total:10.1f}"
+                f" {first * 1000:6.1f} ms {calls:11d}"
+            )
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
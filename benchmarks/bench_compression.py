@@ -0,0 +1,132 @@
+"""
+Benchmark CPU cost and bytes saved by response compression.
+
+Usage::
+
+    python benchmarks/bench_compression.py [--repeat 20] [--bandwidth 10]
+
+Renders realistic ``searchRetrieve`` responses (Hits and Advanced Data View,
+250 and 1000 records) through the full app against a local Korp stand-in,
+then compresses them with `CompressionMiddleware` at different levels, both
+as a single buffered chunk and streamed in 8 KiB chunks. The estimated
+transfer time is for the given bandwidth (MBit/s).
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from clarin.sru.server.config import SRUServerConfigKey  # noqa: E402
+from korp_stub import KorpStubServer  # noqa: E402
+from werkzeug.test import Client  # noqa: E402
+
+from korp_endpoint.app import make_app  # noqa: E402
+from korp_endpoint.compression import CompressionMiddleware  # noqa: E402
+from korp_endpoint.endpoint import API_BASE_URL_KEY  # noqa: E402
+from korp_endpoint.endpoint import RESULT_SET_TTL_KEY  # noqa: E402
+from korp_endpoint.wsgi import COMPRESSION_LEVEL_KEY  # noqa: E402
+
+# ---------------------------------------------------------------------------
+
+
+CQL = "query=katten"
+FCS = "queryType=fcs&query=%5bword%3d%22katten%22%5d"
+
+RESPONSES = [
+    # label, query, records
+    ("hits 250", CQL, 250),
+    ("hits 1000", CQL, 1000),
+    ("advanced 250", FCS, 250),
+    ("advanced 1000", FCS, 1000),
+]
+LEVELS = [1, 3, 6, 9]
+CHUNK_SIZE = 8 * 1024
+
+
+def render_responses():
+    server = KorpStubServer().start()
+    try:
+        app = make_app(
+            {
+                API_BASE_URL_KEY: server.api_base_url,
+                RESULT_SET_TTL_KEY: "0",
+                COMPRESSION_LEVEL_KEY: "0",
+                SRUServerConfigKey.SRU_MAXIMUM_RECORDS: "1000",
+            }
+        )
+        client = Client(app)
+        bodies = []
+        for label, query, records in RESPONSES:
+            url = f"/?operation=searchRetrieve&{query}&maximumRecords={records}"
+            bodies.append((label, client.get(url).data))
+        return bodies
+    finally:
+        server.stop()
+
+
+def make_body_app(body: bytes, streamed: bool):
+    def app(environ, start_response):
+        headers = [("Content-Type", "application/xml")]
+        if streamed:
+            start_response("200 OK", headers)
+            return [body[i : i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)]
+        headers.append(("Content-Length", str(len(body))))
+        start_response("200 OK", headers)
+        return [body]
+
+    return app
+
+
+def compress(app) -> bytes:
+    environ = {"REQUEST_METHOD": "GET", "HTTP_ACCEPT_ENCODING": "gzip"}
+    return b"".join(app(environ, lambda status, headers, exc_info=None: None))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--bandwidth", type=float, default=10.0)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    bytes_per_sec = args.bandwidth * 1_000_000 / 8
+
+    for label, body in render_responses():
+        print(f"\n{label}: {len(body) / 1024:.0f} KiB uncompressed")
+        print(
+            f"  {'level':<12} {'size':>10} {'saved':>7} {'cpu':>9}"
+            f" {'transfer':>10} {'total':>9}"
+        )
+        transfer = len(body) / bytes_per_sec
+        print(
+            f"  {'none':<12} {len(body) / 1024:6.0f} KiB {0:6.0%} {0:6.2f} ms"
+            f" {transfer * 1000:7.1f} ms {transfer * 1000:6.1f} ms"
+        )
+        for streamed in (False, True):
+            for level in LEVELS:
+                app = CompressionMiddleware(
+                    make_body_app(body, streamed), level=level, min_size=1024
+                )
+                data = compress(app)
+                times = []
+                for _ in range(args.repeat):
+                    start = time.process_time()
+                    compress(app)
+                    times.append(time.process_time() - start)
+                cpu = statistics.median(times)
+                transfer = len(data) / bytes_per_sec
+                name = f"{level}{' streamed' if streamed else ''}"
+                print(
+                    f"  {name:<12} {len(data) / 1024:6.0f} KiB"
+                    f" {1 - len(data) / len(body):6.0%} {cpu * 1000:6.2f} ms"
+                    f" {transfer * 1000:7.1f} ms {(cpu + transfer) * 1000:6.1f} ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Benchmark the endpoint under concurrent requests.
+
+Usage::
+
+    python benchmarks/bench_concurrency.py [--requests 400] \
+        [--concurrency 16] [--latency 0.05]
+
+Sends the same ``searchRetrieve`` load to gunicorn (required) with sync,
+threaded (``gthread``) and multi-process setups on this machine, all
+against a local Korp stand-in with the given latency. Reports throughput,
+latency percentiles and the memory (PSS) of all worker processes.
+
+The correctness of concurrent requests (thread-local sessions, result
+sets, forked workers) is tested in ``tests/test_sessions.py``.
+"""
+
+import argparse
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from korp_stub import KorpStubServer  # noqa: E402
+
+from korp_endpoint.app import make_app  # noqa: E402
+from korp_endpoint.endpoint import API_BASE_URL_KEY  # noqa: E402
+from korp_endpoint.replay import format_report  # noqa: E402
+from korp_endpoint.replay import percentile  # noqa: E402
+from korp_endpoint.replay import replay  # noqa: E402
+
+# ---------------------------------------------------------------------------
+
+
+SETUPS = [
+    # label, workers, threads
+    ("sync 1x1", 1, 1),
+    ("sync 4x1 (processes)", 4, 1),
+    ("gthread 1x16", 1, 16),
+    ("gthread 2x8", 2, 8),
+]
+RECORDS = 10
+
+
+def make_bench_app():
+    """App factory for the gunicorn runs (see `run_gunicorn`)."""
+    logging.disable(logging.WARNING)
+    return make_app({API_BASE_URL_KEY: os.environ["KORP_BENCH_API_BASE_URL"]})
+
+
+# ---------------------------------------------------------------------------
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def worker_pss(master_pid: int) -> int:
+    """Sum of proportional set sizes (kB) of the gunicorn workers."""
+    total = 0
+    try:
+        with open(f"/proc/{master_pid}/task/{master_pid}/children") as fp:
+            children = [int(pid) for pid in fp.read().split()]
+        for pid in children:
+            with open(f"/proc/{pid}/smaps_rollup") as fp:
+                for line in fp:
+                    if line.startswith("Pss:"):
+                        total += int(line.split()[1])
+    except OSError:
+        return 0
+    return total
+
+
+def run_gunicorn(server, label, workers, threads, targets, concurrency):
+    port = free_port()
+    env = dict(
+        os.environ,
+        KORP_BENCH_API_BASE_URL=server.api_base_url,
+        GUNICORN_NUM_WORKERS=str(workers),
+        GUNICORN_NUM_THREADS=str(threads),
+    )
+    proc = subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "gunicorn",
+            "--config",
+            "python:korp_endpoint.gunicorn_config",
+            "--bind",
+            f"127.0.0.1:{port}",
+            "--preload",
+            "--log-level",
+            "warning",
+            "--chdir",
+            os.path.dirname(os.path.abspath(__file__)),
+            "bench_concurrency:make_bench_app()",
+        ],
+        env=env,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        import requests
+
+        for _ in range(100):
+            try:
+                if requests.get(f"{base_url}/?operation=explain").ok:
+                    break
+            except requests.exceptions.ConnectionError:
+                pass
+            time.sleep(0.1)
+        else:
+            raise RuntimeError(f"gunicorn ({label}) did not start")
+
+        replay(base_url, targets[: len(targets) // 10], concurrency=concurrency)
+        result = replay(base_url, targets, concurrency=concurrency)
+        pss = worker_pss(proc.pid)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+    lat = sorted(result.latencies)
+    ok = result.statuses.get(200, 0)
+    print(
+        f"  {label:<22} {ok / result.duration:8.1f} req/s"
+        f"  p50 {percentile(lat, 50) * 1000:6.1f} ms"
+        f"  p95 {percentile(lat, 95) * 1000:6.1f} ms"
+        f"  workers {pss / 1024:6.1f} MiB"
+        f"  failed {len(targets) - ok}"
+    )
+    if ok != len(targets):
+        print(format_report(result))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    try:
+        import gunicorn  # noqa: F401
+    except ImportError:
+        sys.exit("gunicorn is not installed")
+
+    logging.disable(logging.WARNING)
+    server = KorpStubServer(latency=args.latency).start()
+    try:
+        rng = random.Random(1)
+        targets = [
+            f"/?operation=searchRetrieve&query=ord{rng.randrange(1000)}"
+            f"&maximumRecords={RECORDS}"
+            for _ in range(args.requests)
+        ]
+        print(
+            f"\n{args.requests} searchRetrieve requests, concurrency"
+            f" {args.concurrency}, Korp latency {args.latency * 1000:.0f} ms,"
+            f" {os.cpu_count()} CPUs"
+        )
+        for label, workers, threads in SETUPS:
+            run_gunicorn(server, label, workers, threads, targets, args.concurrency)
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Benchmark Boolean CQL queries compiled into a single CQP query.
+
+Usage::
+
+    python benchmarks/bench_cql_boolean.py [--repeat 20] [--latency 0.05]
+
+Before, ``cql2cqp`` rejected ``AND``/``OR``/``NOT`` and aggregators had to
+send one ``searchRetrieve`` request per operand and merge the results
+themselves. This runs both variants through the full app against a local
+Korp stand-in with the given latency and compares the number of upstream
+(Korp) calls, the latency and the number of bytes sent to the client:
+
+1. "multi": one request per operand, sequentially (client-side merge),
+2. "multi parallel": one request per operand, concurrently,
+3. "compiled": a single request with the Boolean query.
+
+The compiled CQP queries are printed first. The stand-in does not evaluate
+CQP, so only the request overhead is measured, not the Korp search cost.
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import cql  # noqa: E402
+from clarin.sru.queryparser import CQLQuery  # noqa: E402
+from korp_stub import KorpStubServer  # noqa: E402
+from werkzeug.test import Client  # noqa: E402
+
+from korp_endpoint.app import make_app  # noqa: E402
+from korp_endpoint.endpoint import API_BASE_URL_KEY  # noqa: E402
+from korp_endpoint.endpoint import RESULT_SET_TTL_KEY  # noqa: E402
+from korp_endpoint.query_converter import cql2cqp  # noqa: E402
+
+# ---------------------------------------------------------------------------
+
+
+QUERIES = [
+    # Boolean query, operands a client would have to query separately
+    ("katten OR hunden", ["katten", "hunden"]),
+    ("katten AND hunden", ["katten", "hunden"]),
+    ("katten AND hunden AND musen", ["katten", "hunden", "musen"]),
+    ("(katten OR hunden) AND musen", ["katten", "hunden", "musen"]),
+    ("katten NOT hunden", ["katten", "hunden"]),
+]
+
+
+def search(client: Client, query: str) -> int:
+    url = f"/?operation=searchRetrieve&maximumRecords=50&query={quote(query)}"
+    resp = client.get(url)
+    assert resp.status_code == 200 and b"<fcs:Resource" in resp.data, resp.data
+    return len(resp.data)
+
+
+def run(app, server, queries, repeat: int, parallel: bool):
+    client = Client(app)
+    before = len(server.requests)
+    times = []
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        if parallel and len(queries) > 1:
+            with ThreadPoolExecutor(len(queries)) as executor:
+                size += sum(executor.map(lambda q: search(Client(app), q), queries))
+        else:
+            size += sum(search(client, q) for q in queries)
+        times.append(time.perf_counter() - start)
+    calls = sum(
+        1 for params in server.requests[before:] if params.get("command") == ["query"]
+    )
+    return statistics.median(times), calls / repeat, size / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    print("compiled CQP queries:")
+    for query, _ in QUERIES:
+        print(f"  {query}\n    {cql2cqp(CQLQuery(query, cql.parse(query)))}")
+
+    server = KorpStubServer(latency=args.latency).start()
+    try:
+        app = make_app({API_BASE_URL_KEY: server.api_base_url, RESULT_SET_TTL_KEY: "0"})
+        print(f"\nKorp latency {args.latency * 1000:.0f} ms, {args.repeat} runs each")
+        print(
+            f"  {'query':<30} {'variant':<15} {'korp calls':>10}"
+            f" {'median':>10} {'response':>10}"
+        )
+        for query, operands in QUERIES:
+            variants = [
+                ("multi", operands, False),
+                ("multi parallel", operands, True),
+                ("compiled", [query], False),
+            ]
+            for label, queries, parallel in variants:
+                median, calls, size = run(app, server, queries, args.repeat, parallel)
+                print(
+                    f"  {query:<30} {label:<15} {calls:10.1f}"
+                    f" {median * 1000:7.1f} ms {size / 1024:6.1f} KiB"
+                )
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark JSON decoders on realistic Korp query responses.
+
+Usage::
+
+    python benchmarks/bench_json_decode.py [--repeat 20]
+
+Compares all installed decoders from `korp_endpoint.korp.JSON_DECODERS`
+against ``requests``' own ``Response.json()`` (text decoding + stdlib).
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from korp_payloads import make_query_payload  # noqa: E402
+
+from korp_endpoint.korp import JSON_DECODERS  # noqa: E402
+from korp_endpoint.korp import load_json_decoder  # noqa: E402
+
+# ---------------------------------------------------------------------------
+
+
+def make_response(payload: bytes) -> requests.Response:
+    resp = requests.Response()
+    resp._content = payload
+    resp.status_code = 200
+    resp.headers["Content-Type"] = "application/json"
+    return resp
+
+
+def timeit(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    for hits in (250, 1000):
+        payload = make_query_payload(hits)
+        print(f"\n{hits} hits, payload: {len(payload) / 1024 / 1024:.2f} MiB")
+
+        # baseline (what 'resp.json()' did), no encoding set => chardet
+        t_base = timeit(lambda: make_response(payload).json(), args.repeat)
+        print(f"  {'requests.json()':<16} {t_base * 1000:8.2f} ms   1.00x")
+
+        for name in JSON_DECODERS:
+            decoder = load_json_decoder(name)
+            if decoder is None:
+                print(f"  {name:<16} (not installed)")
+                continue
+            t = timeit(lambda: decoder(make_response(payload).content), args.repeat)
+            print(f"  {name:<16} {t * 1000:8.2f} ms {t_base / t:6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
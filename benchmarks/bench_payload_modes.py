@@ -0,0 +1,110 @@
+"""
+Benchmark upstream payload size and end-to-end latency per query mode.
+
+Usage::
+
+    python benchmarks/bench_payload_modes.py [--repeat 10]
+
+Runs ``searchRetrieve`` requests through the full app against a local Korp
+stand-in, for CQL (Hits view only) and FCS-QL (Advanced view) queries with
+different context settings. The "legacy" mode always requests ``msd`` and
+``lemma`` with sentence context, as before.
+"""
+
+import argparse
+import logging
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from clarin.sru.server.config import SRUServerConfigKey  # noqa: E402
+from korp_stub import KorpStubServer  # noqa: E402
+from werkzeug.test import Client  # noqa: E402
+
+from korp_endpoint.app import make_app  # noqa: E402
+from korp_endpoint.endpoint import API_BASE_URL_KEY  # noqa: E402
+from korp_endpoint.endpoint import CONTEXT_KEY  # noqa: E402
+from korp_endpoint.endpoint import RESULT_SET_TTL_KEY  # noqa: E402
+from korp_endpoint.endpoint import KorpEndpointSearchEngine  # noqa: E402
+from korp_endpoint.korp import SHOW_ADVANCED  # noqa: E402
+
+# ---------------------------------------------------------------------------
+
+
+CQL = "query=katten"
+FCS = "queryType=fcs&query=%5bword%3d%22katten%22%5d"
+
+MODES = [
+    # label, query, context, legacy
+    ("legacy cql", CQL, "sentence", True),
+    ("cql", CQL, "sentence", False),
+    ("cql 5 tokens", CQL, "5", False),
+    ("cql no context", CQL, "none", False),
+    ("fcs", FCS, "sentence", False),
+    ("fcs 5 tokens", FCS, "5", False),
+]
+
+
+@contextmanager
+def legacy_attributes(enabled: bool):
+    if not enabled:
+        yield
+        return
+    with mock.patch.object(
+        KorpEndpointSearchEngine,
+        "_get_show_attributes",
+        lambda self, request: SHOW_ADVANCED,
+    ):
+        yield
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    server = KorpStubServer().start()
+
+    try:
+        for records in (250, 1000):
+            print(f"\nmaximumRecords={records}")
+            print(f"  {'mode':<16} {'upstream':>12} {'response':>12} {'latency':>10}")
+            for label, query, context, legacy in MODES:
+                app = make_app(
+                    {
+                        API_BASE_URL_KEY: server.api_base_url,
+                        CONTEXT_KEY: context,
+                        RESULT_SET_TTL_KEY: "0",
+                        SRUServerConfigKey.SRU_MAXIMUM_RECORDS: "1000",
+                    }
+                )
+                client = Client(app)
+                url = f"/?operation=searchRetrieve&{query}&maximumRecords={records}"
+
+                with legacy_attributes(legacy):
+                    client.get(url)  # warm up
+                    sent = server.bytes_sent
+                    times = []
+                    for _ in range(args.repeat):
+                        start = time.perf_counter()
+                        resp = client.get(url)
+                        times.append(time.perf_counter() - start)
+                    upstream = (server.bytes_sent - sent) / args.repeat
+
+                print(
+                    f"  {label:<16} {upstream / 1024:9.0f} KiB"
+                    f" {len(resp.data) / 1024:9.0f} KiB"
+                    f" {statistics.median(times) * 1000:7.1f} ms"
+                )
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""
+Benchmark worker cold start: import time and time to first response.
+
+Usage::
+
+    python benchmarks/bench_startup.py [--runs 5] [--latency 0.2]
+
+Each run starts a fresh interpreter that imports the app, initializes it
+against a local Korp stand-in (with artificial network latency) and
+serves a first ``explain`` and ``searchRetrieve`` request. Runs are done
+without startup snapshots, and with a warm snapshot directory.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# ---------------------------------------------------------------------------
+
+
+def child(api_base_url: str, snapshot_dir: str) -> None:
+    t0 = time.perf_counter()
+    from korp_endpoint.app import make_app
+    from korp_endpoint.endpoint import API_BASE_URL_KEY
+    from korp_endpoint.endpoint import SNAPSHOT_DIR_KEY
+
+    t_import = time.perf_counter() - t0
+
+    from werkzeug.test import Client
+
+    params = {API_BASE_URL_KEY: api_base_url}
+    if snapshot_dir:
+        params[SNAPSHOT_DIR_KEY] = snapshot_dir
+    app = make_app(params)
+    t_init = time.perf_counter() - t0
+
+    client = Client(app)
+    client.get("/?operation=explain&x-fcs-endpoint-description=true")
+    t_explain = time.perf_counter() - t0
+    client.get("/?operation=searchRetrieve&query=katten&maximumRecords=10")
+    t_search = time.perf_counter() - t0
+
+    print(
+        json.dumps(
+            {
+                "import": t_import,
+                "init": t_init,
+                "explain": t_explain,
+                "search": t_search,
+            }
+        )
+    )
+
+
+def run(api_base_url: str, snapshot_dir: str) -> dict:
+    proc = subprocess.run(
+        [sys.executable, __file__, "--child", api_base_url, snapshot_dir],
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def report(label: str, results: list) -> None:
+    print(f"\n{label}")
+    for key in ("import", "init", "explain", "search"):
+        values = [r[key] * 1000 for r in results]
+        print(f"  {key + ' done':<14} {statistics.median(values):8.1f} ms (median)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.2)
+    args = parser.parse_args()
+
+    sys.path.insert(0, HERE)
+    from korp_stub import KorpStubServer
+
+    server = KorpStubServer(latency=args.latency).start()
+    try:
+        report(
+            "no snapshots",
+            [run(server.api_base_url, "") for _ in range(args.runs)],
+        )
+        with tempfile.TemporaryDirectory() as snapshot_dir:
+            run(server.api_base_url, snapshot_dir)  # fill snapshots
+            report(
+                "warm snapshots",
+                [run(server.api_base_url, snapshot_dir) for _ in range(args.runs)],
+            )
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        child(sys.argv[2], sys.argv[3])
+    else:
+        main()
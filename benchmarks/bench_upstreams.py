@@ -0,0 +1,180 @@
+"""
+Benchmark latency-aware routing across multiple Korp mirrors.
+
+Usage::
+
+    python benchmarks/bench_upstreams.py [--requests 200] [--concurrency 4]
+
+Starts three local Korp stand-ins with different latencies (and one with
+occasional server errors) and runs ``searchRetrieve`` requests through the
+full app:
+
+1. against each upstream alone,
+2. against all three with `UpstreamPool` routing,
+3. with the fastest upstream stopped (failover) and restarted (restore).
+
+Finally, corpus affinity is compared by running queries on random corpus
+subsets and counting how often the same subset went to the same upstream.
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+from collections import Counter
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from korp_payloads import CORPORA  # noqa: E402
+from korp_stub import KorpStubServer  # noqa: E402
+from werkzeug.test import Client  # noqa: E402
+
+from korp_endpoint.app import make_app  # noqa: E402
+from korp_endpoint.endpoint import API_BASE_URL_KEY  # noqa: E402
+from korp_endpoint.endpoint import RESULT_SET_TTL_KEY  # noqa: E402
+from korp_endpoint.endpoint import UPSTREAM_COOLDOWN_KEY  # noqa: E402
+from korp_endpoint.korp import make_query  # noqa: E402
+from korp_endpoint.upstreams import UpstreamPool  # noqa: E402
+
+# ---------------------------------------------------------------------------
+
+
+UPSTREAMS = [
+    # label, latency, error rate
+    ("fast", 0.010, 0.0),
+    ("medium", 0.030, 0.0),
+    ("slow+errors", 0.060, 0.1),
+]
+URL = "/?operation=searchRetrieve&query=katten&maximumRecords=10"
+
+
+def run(app, requests: int, concurrency: int):
+    def _one(_):
+        client = Client(app)
+        start = time.perf_counter()
+        resp = client.get(URL)
+        ok = resp.status_code == 200 and b"<fcs:Resource" in resp.data
+        return time.perf_counter() - start, ok
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(_one, range(requests)))
+    times = sorted(t for t, _ in results)
+    failed = sum(1 for _, ok in results if not ok)
+    return times, failed
+
+
+def report(label, servers, times, failed, before):
+    counts = [len(s.requests) - b for s, b in zip(servers, before)]
+    total = sum(counts) or 1
+    share = " ".join(
+        f"{name}={count / total:4.0%}" for (name, _, _), count in zip(UPSTREAMS, counts)
+    )
+    print(
+        f"  {label:<22} median {statistics.median(times) * 1000:6.1f} ms"
+        f"  p95 {times[int(len(times) * 0.95) - 1] * 1000:6.1f} ms"
+        f"  failed {failed:3d}  {share}"
+    )
+
+
+def make_pool_app(servers, cooldown=1):
+    return make_app(
+        {
+            API_BASE_URL_KEY: ",".join(s.api_base_url for s in servers),
+            RESULT_SET_TTL_KEY: "0",
+            UPSTREAM_COOLDOWN_KEY: str(cooldown),
+        }
+    )
+
+
+def bench_affinity(queries: int, concurrency: int):
+    rng = random.Random(1)
+    subsets = [",".join(sorted(rng.sample(CORPORA, 3))) for _ in range(10)]
+    print(f"\ncorpus affinity ({len(subsets)} corpus subsets, 2 equal upstreams)")
+    for affinity in (False, True):
+        servers = [KorpStubServer(latency=0.010).start() for _ in range(2)]
+        try:
+            pool = UpstreamPool([s.api_base_url for s in servers], affinity=affinity)
+            with ThreadPoolExecutor(concurrency) as executor:
+                list(
+                    executor.map(
+                        lambda i: make_query(
+                            "[]", subsets[i % len(subsets)], 1, 10, api_base_url=pool
+                        ),
+                        range(queries),
+                    )
+                )
+            seen = defaultdict(Counter)
+            for index, server in enumerate(servers):
+                for params in server.requests:
+                    if params.get("command") == ["query"]:
+                        seen[params["corpus"][0]][index] += 1
+            sticky = sum(c.most_common(1)[0][1] for c in seen.values()) / queries
+            share = [sum(c[i] for c in seen.values()) / queries for i in range(2)]
+            print(
+                f"  affinity={str(affinity):<5}  same upstream per subset: {sticky:4.0%}"
+                f"  load: {share[0]:.0%} / {share[1]:.0%}"
+            )
+        finally:
+            for server in servers:
+                server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    random.seed(42)
+    servers = [
+        KorpStubServer(latency=latency, error_rate=errors).start()
+        for _, latency, errors in UPSTREAMS
+    ]
+
+    try:
+        print(f"{args.requests} requests, concurrency {args.concurrency}")
+        for server, (name, _, _) in zip(servers, UPSTREAMS):
+            app = make_app(
+                {API_BASE_URL_KEY: server.api_base_url, RESULT_SET_TTL_KEY: "0"}
+            )
+            before = [len(s.requests) for s in servers]
+            times, failed = run(app, args.requests, args.concurrency)
+            report(f"single {name}", servers, times, failed, before)
+
+        app = make_pool_app(servers)
+        before = [len(s.requests) for s in servers]
+        times, failed = run(app, args.requests, args.concurrency)
+        report("pool", servers, times, failed, before)
+
+        # failover: stop fastest upstream
+        port = servers[0].server_address[1]
+        servers[0].stop()
+        before = [len(s.requests) for s in servers]
+        times, failed = run(app, args.requests, args.concurrency)
+        report("pool, fast down", servers, times, failed, before)
+
+        # restore: restart on same port, wait for cooldown
+        servers[0] = KorpStubServer(latency=UPSTREAMS[0][1], port=port).start()
+        time.sleep(1.1)
+        before = [len(s.requests) for s in servers]
+        times, failed = run(app, args.requests, args.concurrency)
+        report("pool, fast restored", servers, times, failed, before)
+
+    finally:
+        for server in servers:
+            try:
+                server.stop()
+            except OSError:
+                pass
+
+    bench_affinity(args.requests, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
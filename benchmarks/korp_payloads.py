@@ -0,0 +1,131 @@
+"""
+Synthetic Korp API payloads for benchmarks.
+
+The generated ``command=query`` responses mimic the shape of real Korp v6
+responses (``defaultcontext=1 sentence``, ``show=msd,lemma``).
+"""
+
+import json
+import random
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+
+# ---------------------------------------------------------------------------
+
+
+WORDS = [
+    ("katten", "NN.UTR.SIN.DEF.NOM", "|katt|"),
+    ("sover", "VB.PRS.AKT", "|sova|"),
+    ("på", "PP", "|på|"),
+    ("mattan", "NN.UTR.SIN.DEF.NOM", "|matta|"),
+    ("och", "KN", "|och|"),
+    ("hunden", "NN.UTR.SIN.DEF.NOM", "|hund|"),
+    ("springer", "VB.PRS.AKT", "|springa|"),
+    ("ute", "AB", "|ute|"),
+    ("i", "PP", "|i|"),
+    ("trädgården", "NN.UTR.SIN.DEF.NOM", "|trädgård|"),
+    ("med", "PP", "|med|"),
+    ("en", "DT.UTR.SIN.IND", "|en|"),
+    ("stor", "JJ.POS.UTR.SIN.IND.NOM", "|stor|"),
+    ("röd", "JJ.POS.UTR.SIN.IND.NOM", "|röd|"),
+    ("boll", "NN.UTR.SIN.IND.NOM", "|boll|"),
+    ("som", "HP.-.-.-", "|som|"),
+    ("barnen", "NN.NEU.PLU.DEF.NOM", "|barn|"),
+    ("har", "VB.PRS.AKT", "|ha|"),
+    ("glömt", "VB.SUP.AKT", "|glömma|"),
+    ("där", "AB", "|där|"),
+    ("igår", "AB", "|igår|"),
+    ("Stockholm", "PM.NOM", "|Stockholm|"),
+    ("1998", "RG.NOM", "|"),
+    (",", "MID", "|"),
+]
+
+CORPORA = ["SUC3", "GP2012", "WEBBNYHETER2013", "BLOGGMIX2010", "ROMI", "TALBANKEN"]
+CORPUS_SIZES = {
+    "SUC3": 1_166_593,
+    "GP2012": 22_387_004,
+    "WEBBNYHETER2013": 31_590_224,
+    "BLOGGMIX2010": 74_290_011,
+    "ROMI": 4_016_340,
+    "TALBANKEN": 324_826,
+}
+CORPUS_HITS = {
+    "SUC3": 31,
+    "GP2012": 604,
+    "WEBBNYHETER2013": 851,
+    "BLOGGMIX2010": 2_004,
+    "ROMI": 108,
+    "TALBANKEN": 9,
+}
+"""Hits of a common word per corpus"""
+
+
+def make_token(rng: random.Random, lean: bool = False) -> Dict[str, str]:
+    word, msd, lemma = rng.choice(WORDS)
+    if lean:
+        return {"word": word}
+    return {"word": word, "msd": msd, "lemma": lemma}
+
+
+def make_query_result(
+    hits: int,
+    seed: int = 42,
+    lean: bool = False,
+    context: Optional[int] = None,
+) -> Dict[str, Any]:
+    """Build a Korp ``command=query`` result.
+
+    Args:
+        hits: number of kwic lines
+        seed: random seed for reproducible payloads
+        lean: only include the ``word`` attribute for tokens
+        context: number of context tokens on each side, or ``None``
+            for sentence context (10-40 tokens)
+
+    Returns:
+        Dict[str, Any]: the (JSON compatible) Korp response
+    """
+    rng = random.Random(seed)
+    kwic: List[Dict[str, Any]] = []
+    for _ in range(hits):
+        if context is None:
+            length = rng.randint(10, 40)
+            match_start = rng.randrange(length)
+        else:
+            length = 2 * context + 1
+            match_start = context
+        tokens = [make_token(rng, lean=lean) for _ in range(length)]
+        kwic.append(
+            {
+                "corpus": rng.choice(CORPORA),
+                "match": {
+                    "start": match_start,
+                    "end": match_start + 1,
+                    "position": rng.randrange(10_000_000),
+                },
+                "tokens": tokens,
+            }
+        )
+
+    total = hits * 37
+    corpus_hits = {corpus: total // len(CORPORA) for corpus in CORPORA}
+    return {
+        "hits": total,
+        "corpus_hits": corpus_hits,
+        "corpus_order": CORPORA,
+        "kwic": kwic,
+        "querydata": "x" * 64,
+        "time": 0.42,
+    }
+
+
+def make_query_payload(hits: int, **kwargs) -> bytes:
+    """Same as `make_query_result` but serialized to JSON bytes."""
+    return json.dumps(make_query_result(hits, **kwargs), ensure_ascii=False).encode(
+        "utf-8"
+    )
+
+
+# ---------------------------------------------------------------------------
@@ -0,0 +1,149 @@
+"""
+A local stand-in for the Korp API, used by benchmarks.
+
+Serves ``command=info`` and ``command=query`` with synthetic payloads
+(see `korp_payloads`) and a configurable artificial latency.
+"""
+
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from typing import Dict
+from typing import List
+from urllib.parse import parse_qs
+from urllib.parse import urlsplit
+
+from korp_payloads import CORPORA
+from korp_payloads import CORPUS_HITS
+from korp_payloads import CORPUS_SIZES
+from korp_payloads import make_query_result
+
+# ---------------------------------------------------------------------------
+
+
+class KorpStubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        corpus_latency: float = 0.0,
+        port: int = 0,
+        error_rate: float = 0.0,
+    ) -> None:
+        """[Constructor]
+
+        Args:
+            latency: artificial latency for each request in seconds
+            corpus_latency: additional latency for each queried corpus
+            port: port to listen on, ``0`` to choose a free one
+            error_rate: fraction of queries answered with HTTP 500
+        """
+        super().__init__(("127.0.0.1", port), KorpStubHandler)
+        self.latency = latency
+        self.corpus_latency = corpus_latency
+        self.error_rate = error_rate
+        self.requests: List[Dict[str, List[str]]] = []
+        self.bytes_sent = 0
+        self._payload_cache: Dict[tuple, bytes] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def api_base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+    def start(self) -> "KorpStubServer":
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+    def handle_error(self, request, client_address) -> None:
+        # clients that gave up (timeouts) are expected
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def payload(self, params: Dict[str, List[str]]) -> bytes:
+        command = params.get("command", [""])[0]
+        if command == "info" and "corpus" not in params:
+            return json.dumps(
+                {"corpora": CORPORA, "protected_corpora": [], "version": "stub"}
+            ).encode("utf-8")
+        if command == "info":
+            corpora = params["corpus"][0].split(",")
+            return json.dumps(
+                {
+                    "corpora": {
+                        c: {"attrs": {}, "info": {"Size": str(CORPUS_SIZES[c])}}
+                        for c in corpora
+                    }
+                }
+            ).encode("utf-8")
+        if command == "query":
+            corpora = params["corpus"][0].split(",")
+            hits = sum(CORPUS_HITS.get(c, 0) for c in corpora)
+            start = int(params.get("start", ["0"])[0])
+            end = min(int(params.get("end", ["249"])[0]), hits - 1)
+            lean = "show" not in params
+            size, unit = params.get("defaultcontext", ["1 sentence"])[0].split()
+            context = int(size) if unit.startswith("word") else None
+            key = (max(0, end - start + 1), lean, context, tuple(corpora))
+            with self._lock:
+                if key not in self._payload_cache:
+                    result = make_query_result(key[0], lean=lean, context=context)
+                    result["hits"] = hits
+                    result["corpus_hits"] = {c: CORPUS_HITS[c] for c in corpora}
+                    self._payload_cache[key] = json.dumps(
+                        result, ensure_ascii=False
+                    ).encode("utf-8")
+                return self._payload_cache[key]
+        return json.dumps({"ERROR": {"type": "ValueError"}}).encode("utf-8")
+
+
+class KorpStubHandler(BaseHTTPRequestHandler):
+    server: KorpStubServer
+
+    def do_GET(self) -> None:
+        self.handle_params(parse_qs(urlsplit(self.path).query))
+
+    def do_POST(self) -> None:
+        params = parse_qs(urlsplit(self.path).query)
+        length = int(self.headers.get("Content-Length", 0))
+        params.update(parse_qs(self.rfile.read(length).decode("utf-8")))
+        self.handle_params(params)
+
+    def handle_params(self, params: Dict[str, List[str]]) -> None:
+        with self.server._lock:
+            self.server.requests.append(params)
+        latency = self.server.latency
+        if "corpus" in params and params.get("command") == ["query"]:
+            latency += self.server.corpus_latency * len(params["corpus"][0].split(","))
+        if latency:
+            time.sleep(latency)
+
+        is_query = params.get("command") == ["query"]
+        if is_query and random.random() < self.server.error_rate:
+            self.send_error(500)
+            return
+
+        body = self.server.payload(params)
+        with self.server._lock:
+            self.server.bytes_sent += len(body)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+# ---------------------------------------------------------------------------
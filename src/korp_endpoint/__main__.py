@@ -2,6 +2,7 @@ from korp_endpoint.app import make_app
 
 if __name__ == "__main__":
     import contextvars
+    import itertools
     import logging
 
     from werkzeug.serving import WSGIRequestHandler
@@ -23,11 +24,11 @@ if __name__ == "__main__":
     handler.addFilter(RequestFilter())
 
     class MyWSGIRequestHandler(WSGIRequestHandler):
-        counter = 1  # not thread-safe I think, see contextvars/threading stuff
+        # next() on itertools.count is atomic, safe for threaded servers
+        counter = itertools.count(1)
 
         def handle_one_request(self) -> None:
-            MyWSGIRequestHandler.counter += 1
-            token = REQUEST_ID.set(f"{MyWSGIRequestHandler.counter:04x}")
+            token = REQUEST_ID.set(f"{next(MyWSGIRequestHandler.counter):04x}")
             # uuid.uuid4().hex[:4])
             try:
                 return super().handle_one_request()
@@ -37,7 +38,12 @@ if __name__ == "__main__":
     app = make_app()
 
     run_simple(
-        "localhost", 8080, app, use_reloader=True, request_handler=MyWSGIRequestHandler
+        "localhost",
+        8080,
+        app,
+        use_reloader=True,
+        threaded=True,
+        request_handler=MyWSGIRequestHandler,
     )
 
     # tests:
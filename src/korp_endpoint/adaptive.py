@@ -0,0 +1,169 @@
+"""
+Adaptive corpus ordering with early termination for small result windows.
+
+Corpora are queried in batches, most productive corpora first (based on
+historical hit counts per corpus), until the requested window is filled.
+The total number of hits is then only a minimum or an estimate.
+"""
+
+import logging
+import threading
+from typing import Any
+from typing import Callable
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from clarin.sru.constants import SRUResultCountPrecision
+
+# ---------------------------------------------------------------------------
+
+
+LOGGER = logging.getLogger(__name__)
+
+QueryFunction = Callable[[List[str], int], Optional[Dict[str, Any]]]
+"""Runs the query on the given corpora for the first N hits."""
+
+
+# ---------------------------------------------------------------------------
+
+
+class CorpusStats:
+    """Thread-safe historical hit density per corpus (exponentially
+    weighted moving average of hits per query)."""
+
+    def __init__(
+        self, corpora_info: Optional[Dict[str, Any]] = None, alpha: float = 0.2
+    ) -> None:
+        """[Constructor]
+
+        Args:
+            corpora_info: Korp corpus info, corpus sizes are used as
+                prior for corpora without statistics
+            alpha: smoothing factor for new observations
+        """
+        self.alpha = alpha
+        self.sizes: Dict[str, int] = {}
+        self._hits: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+        for corpus, info in (corpora_info or {}).items():
+            try:
+                self.sizes[corpus] = int(info["info"]["Size"])
+            except (KeyError, TypeError, ValueError):
+                pass
+
+    def update(self, corpus_hits: Dict[str, int]) -> None:
+        """Add observed hits per corpus (Korp ``corpus_hits``) of a query
+        that was run on all those corpora."""
+        with self._lock:
+            for corpus, hits in corpus_hits.items():
+                old = self._hits.get(corpus)
+                if old is None:
+                    self._hits[corpus] = float(hits)
+                else:
+                    self._hits[corpus] = old + self.alpha * (hits - old)
+
+    def expected_hits(self, corpus: str) -> Optional[float]:
+        return self._hits.get(corpus)
+
+    def order(self, corpora: Sequence[str]) -> List[str]:
+        """Sort corpora by expected hits, descending. Corpora without
+        statistics are ranked by their size scaled to the average hit
+        density of the known corpora."""
+        with self._lock:
+            hits = dict(self._hits)
+
+        known_size = sum(self.sizes.get(c, 0) for c in hits)
+        density = sum(hits.values()) / known_size if known_size else 1.0
+
+        def score(corpus: str) -> float:
+            if corpus in hits:
+                return hits[corpus]
+            return self.sizes.get(corpus, 0) * density
+
+        return sorted(corpora, key=score, reverse=True)
+
+
+# ---------------------------------------------------------------------------
+
+
+def adaptive_query(
+    corpora: Sequence[str],
+    count: int,
+    stats: CorpusStats,
+    query_fn: QueryFunction,
+    initial_batch_size: int = 4,
+) -> Optional[Tuple[Dict[str, Any], SRUResultCountPrecision]]:
+    """Query corpora in priority order until ``count`` hits are found.
+
+    Batches grow geometrically, so even rare words need only a few
+    upstream calls.
+
+    Args:
+        corpora: the corpora to search
+        count: the number of hits (from the start) that are required
+        stats: historical hit statistics for ordering
+        query_fn: runs the query on a batch of corpora
+        initial_batch_size: number of corpora in the first batch
+
+    Returns:
+        Tuple[Dict[str, Any], SRUResultCountPrecision]: a Korp-like result
+            (``hits``, ``kwic`` and ``corpus_hits``) with the precision of
+            the ``hits`` count, or ``None`` if a query failed. ``batches``
+            lists the queried corpus batches with their hits, in the order
+            of the ``kwic`` lines, followed by the skipped corpora (``-1``
+            hits).
+    """
+    ordered = stats.order(corpora)
+    kwic: List[Dict[str, Any]] = []
+    corpus_hits: Dict[str, int] = {}
+    batches: List[Tuple[Tuple[str, ...], int]] = []
+    hits = 0
+    pos = 0
+    batch_size = max(1, initial_batch_size)
+
+    while pos < len(ordered) and len(kwic) < count:
+        batch = ordered[pos : pos + batch_size]
+        pos += len(batch)
+        batch_size *= 2
+
+        result = query_fn(batch, count - len(kwic))
+        if result is None or "hits" not in result:
+            return None
+        hits += result["hits"]
+        batches.append((tuple(batch), result["hits"]))
+        kwic.extend(result.get("kwic", []))
+        corpus_hits.update(result.get("corpus_hits", {}))
+
+    remaining = ordered[pos:]
+    if remaining:
+        batches.append((tuple(remaining), -1))
+    LOGGER.debug(
+        "Adaptive query: %s hits in %s corpora, %s corpora skipped",
+        hits,
+        pos,
+        len(remaining),
+    )
+
+    precision = SRUResultCountPrecision.EXACT
+    if remaining:
+        expected = [stats.expected_hits(c) for c in remaining]
+        if all(e is not None for e in expected):
+            precision = SRUResultCountPrecision.ESTIMATE
+            hits += int(round(sum(expected)))  # type: ignore
+        else:
+            precision = SRUResultCountPrecision.MINIMUM
+
+    result = {
+        "hits": hits,
+        "kwic": kwic,
+        "corpus_hits": corpus_hits,
+        "batches": batches,
+    }
+    return result, precision
+
+
+# ---------------------------------------------------------------------------
@@ -1,53 +1,89 @@
 import os
+from typing import Any
+from typing import Dict
+from typing import Optional
 
 from clarin.sru.constants import SRUVersion
 from clarin.sru.server.config import SRUServerConfigKey
-from clarin.sru.server.wsgi import SRUServerApp
 
 from korp_endpoint.endpoint import API_BASE_URL_KEY
 from korp_endpoint.endpoint import RESOURCE_INVENTORY_URL_KEY
+from korp_endpoint.endpoint import SNAPSHOT_DIR_KEY
 from korp_endpoint.endpoint import KorpEndpointSearchEngine
 from korp_endpoint.korp import API_BASE_URL
+from korp_endpoint.wsgi import PROFILE_DIR_KEY
+from korp_endpoint.wsgi import PROFILE_SAMPLE_RATE_KEY
+from korp_endpoint.wsgi import PROFILE_TOKEN_KEY
+from korp_endpoint.wsgi import KorpSRUServerApp
 
 # ---------------------------------------------------------------------------
 
 
-def make_app():
+def make_app(params: Optional[Dict[str, Any]] = None):
     here = os.path.dirname(__file__)
     config_file = os.path.join(here, "sru-server-config.xml")
     ed_file = os.path.join(here, "endpoint-description.xml")
 
-    app = SRUServerApp(
+    app_params = {
+        RESOURCE_INVENTORY_URL_KEY: ed_file,  # comment out to use bundled
+        # API_BASE_URL_KEY: API_BASE_URL,
+        # JSON_DECODER_KEY: "orjson",  # default: fastest installed
+        #
+        # SRUServerConfigKey.SRU_TRANSPORT: "http",
+        # SRUServerConfigKey.SRU_HOST: "127.0.0.1",
+        # SRUServerConfigKey.SRU_PORT: "8080",
+        # required information
+        SRUServerConfigKey.SRU_DATABASE: "korp",
+        #
+        SRUServerConfigKey.SRU_ECHO_REQUESTS: "true",
+        SRUServerConfigKey.SRU_NUMBER_OF_RECORDS: 250,
+        SRUServerConfigKey.SRU_MAXIMUM_RECORDS: 1000,
+        SRUServerConfigKey.SRU_ALLOW_OVERRIDE_MAXIMUM_RECORDS: "true",
+        SRUServerConfigKey.SRU_ALLOW_OVERRIDE_INDENT_RESPONSE: "true",
+        # To enable SRU 2.0 for FCS 2.0
+        SRUServerConfigKey.SRU_SUPPORTED_VERSION_MAX: SRUVersion.VERSION_2_0,
+        # SRUServerConfigKey.SRU_SUPPORTED_VERSION_DEFAULT: SRUVersion.VERSION_2_0,
+        SRUServerConfigKey.SRU_LEGACY_NAMESPACE_MODE: "loc",
+    }
+    # pickled endpoint description and corpus info for faster (re)starts
+    snapshot_dir = os.environ.get("KORP_ENDPOINT_SNAPSHOT_DIR")
+    if snapshot_dir:
+        app_params[SNAPSHOT_DIR_KEY] = snapshot_dir
+    # opt-in request profiling, inactive without directory
+    for env_name, key in (
+        ("KORP_ENDPOINT_PROFILE_DIR", PROFILE_DIR_KEY),
+        ("KORP_ENDPOINT_PROFILE_TOKEN", PROFILE_TOKEN_KEY),
+        ("KORP_ENDPOINT_PROFILE_SAMPLE_RATE", PROFILE_SAMPLE_RATE_KEY),
+    ):
+        if os.environ.get(env_name):
+            app_params[key] = os.environ[env_name]
+    if params:
+        app_params.update(params)
+
+    app = KorpSRUServerApp(
         KorpEndpointSearchEngine,
         config_file,
-        {
-            RESOURCE_INVENTORY_URL_KEY: ed_file,  # comment out to use bundled
-            # API_BASE_URL_KEY: API_BASE_URL,
-            #
-            # SRUServerConfigKey.SRU_TRANSPORT: "http",
-            # SRUServerConfigKey.SRU_HOST: "127.0.0.1",
-            # SRUServerConfigKey.SRU_PORT: "8080",
-            # required information
-            SRUServerConfigKey.SRU_DATABASE: "korp",
-            #
-            SRUServerConfigKey.SRU_ECHO_REQUESTS: "true",
-            SRUServerConfigKey.SRU_NUMBER_OF_RECORDS: 250,
-            SRUServerConfigKey.SRU_MAXIMUM_RECORDS: 1000,
-            SRUServerConfigKey.SRU_ALLOW_OVERRIDE_MAXIMUM_RECORDS: "true",
-            SRUServerConfigKey.SRU_ALLOW_OVERRIDE_INDENT_RESPONSE: "true",
-            # To enable SRU 2.0 for FCS 2.0
-            SRUServerConfigKey.SRU_SUPPORTED_VERSION_MAX: SRUVersion.VERSION_2_0,
-            # SRUServerConfigKey.SRU_SUPPORTED_VERSION_DEFAULT: SRUVersion.VERSION_2_0,
-            SRUServerConfigKey.SRU_LEGACY_NAMESPACE_MODE: "loc",
-        },
+        app_params,
         develop=True,
     )
     return app
 
 
 def make_gunicorn_app():
-    """Setup logging to display on stdout with gunicorn logging level."""
+    """Setup logging to display on stdout with gunicorn logging level.
+
+    Supports gunicorn's ``--preload`` option: the app (including the
+    Korp corpus info) will then be initialized once in the master process
+    and all workers share its memory copy-on-write after forking. This also
+    covers the imports: ``cql`` and ``fcsql`` cannot be imported lazily, as
+    the ``clarin.sru`` base classes (`SimpleEndpointSearchEngineBase`,
+    `SRUServerApp`) already import them; workers inherit them instead.
 
+    The app is thread-safe, so it can be run with threaded ``gthread``
+    workers, see `korp_endpoint.gunicorn_config` (``GUNICORN_NUM_THREADS``).
+    """
+
+    import gc
     import logging
 
     # https://trstringer.com/logging-flask-gunicorn-the-manageable-way/
@@ -59,7 +95,23 @@ def make_gunicorn_app():
         format="[%(levelname).1s][%(name)s:%(lineno)s] %(message)s",
     )
 
-    return make_app()
+    app = make_app()
+
+    # run the most frequent queries of the access log, so result sets and
+    # Korp-side caches are warm before taking traffic
+    warmup_log = os.environ.get("KORP_ENDPOINT_WARMUP_LOG")
+    if warmup_log:
+        from korp_endpoint.replay import warm_up_from_log
+
+        top_n = int(os.environ.get("KORP_ENDPOINT_WARMUP_TOP", "20"))
+        warm_up_from_log(app, warmup_log, top_n=top_n)
+
+    # move all objects created during initialization into the permanent
+    # generation, the garbage collector will then not touch (and copy)
+    # memory pages shared with forked workers
+    gc.freeze()
+
+    return app
 
 
 # ---------------------------------------------------------------------------
@@ -0,0 +1,380 @@
+"""
+Batch search: many CQL/FCS-QL queries in one HTTP request.
+
+Queries are parsed and translated up front, identical Korp queries are
+run only once, and the distinct queries run with bounded parallelism over
+the shared (keep-alive) Korp connections. Results are streamed back as
+newline-delimited JSON, one line per query in completion order.
+"""
+
+import json
+import logging
+import threading
+import typing
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import Future
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import wait
+from dataclasses import dataclass
+from typing import Any
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Set
+from typing import Tuple
+
+import cql
+from clarin.sru.constants import SRUDiagnostics
+from clarin.sru.constants import SRUParam
+from clarin.sru.constants import SRUResultCountPrecision
+from clarin.sru.constants import SRUVersion
+from clarin.sru.diagnostic import SRUDiagnosticList
+from clarin.sru.exception import SRUException
+from clarin.sru.fcs.constants import FCSQueryType
+from clarin.sru.fcs.queryparser import FCSQuery
+from clarin.sru.fcs.queryparser import FCSQueryParser
+from clarin.sru.queryparser import CQLQuery
+from clarin.sru.queryparser import SRUQuery
+
+from korp_endpoint.korp import SHOW_ADVANCED
+from korp_endpoint.query_converter import cql2cqp
+from korp_endpoint.query_converter import fcs2cqp
+from korp_endpoint.query_converter import get_cql_within
+
+if typing.TYPE_CHECKING:
+    from korp_endpoint.endpoint import KorpEndpointSearchEngine
+
+
+# ---------------------------------------------------------------------------
+
+
+LOGGER = logging.getLogger(__name__)
+
+QUERY_TYPES = (FCSQueryType.CQL.value, FCSQueryType.FCS.value)
+
+_parsers = threading.local()
+
+
+# ---------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class BatchQuery:
+    query: str
+    query_type: str = FCSQueryType.CQL.value
+    """``cql`` or ``fcs``"""
+    start_record: int = 1
+    maximum_records: Optional[int] = None
+    """Number of records, ``None`` for the server default"""
+
+
+@dataclass(frozen=True)
+class TranslatedQuery:
+    """A Korp query, the key for deduplication."""
+
+    cqp: str
+    show: Tuple[str, ...]
+    within: Optional[str]
+    start_record: int
+    maximum_records: int
+
+
+class _DiagnosticCollector(SRUDiagnosticList):
+    def __init__(self) -> None:
+        self.diagnostics: List[SRUException] = []
+
+    def add_diagnostic(
+        self, uri: str, details: Optional[str] = None, message: Optional[str] = None
+    ) -> None:
+        self.diagnostics.append(SRUException(uri, details, message))
+
+
+# ---------------------------------------------------------------------------
+
+
+def parse_batch(data: Any) -> List[BatchQuery]:
+    """Parse a (decoded) JSON batch request.
+
+    The request is a list of queries, each either a CQL query string or
+    an object with ``query`` and optional ``queryType`` (``cql`` or
+    ``fcs``), ``startRecord`` and ``maximumRecords``.
+
+    Args:
+        data: the decoded JSON request body
+
+    Returns:
+        List[BatchQuery]: the queries
+
+    Raises:
+        ValueError: if the request is malformed
+    """
+    if not isinstance(data, list):
+        raise ValueError("Batch request must be a JSON list of queries")
+
+    queries: List[BatchQuery] = []
+    for index, item in enumerate(data):
+        if isinstance(item, str):
+            item = {"query": item}
+        if not isinstance(item, dict) or not isinstance(item.get("query"), str):
+            raise ValueError(f"Query #{index} must be a string or have a 'query'")
+        query_type = item.get("queryType", FCSQueryType.CQL.value)
+        if query_type not in QUERY_TYPES:
+            raise ValueError(f"Query #{index} has unsupported type: {query_type!r}")
+        start_record = item.get("startRecord", 1)
+        maximum_records = item.get("maximumRecords")
+        if not isinstance(start_record, int) or start_record < 1:
+            raise ValueError(f"Query #{index} has invalid 'startRecord'")
+        if maximum_records is not None and (
+            not isinstance(maximum_records, int) or maximum_records < 0
+        ):
+            raise ValueError(f"Query #{index} has invalid 'maximumRecords'")
+        queries.append(
+            BatchQuery(item["query"], query_type, start_record, maximum_records)
+        )
+    return queries
+
+
+def parse_query(query: BatchQuery) -> SRUQuery:
+    """Parse a query like the SRU server does (SRU 2.0).
+
+    Raises:
+        SRUException: if the query is invalid
+    """
+    if query.query_type == FCSQueryType.CQL.value:
+        try:
+            return CQLQuery(query.query, _get_cql_parser().parse(query.query))
+        except Exception as ex:
+            raise SRUException(
+                SRUDiagnostics.QUERY_SYNTAX_ERROR, message="error parsing query"
+            ) from ex
+
+    diagnostics = _DiagnosticCollector()
+    parsed = FCSQueryParser().parse_query(
+        SRUVersion.VERSION_2_0, {SRUParam.QUERY: query.query}, diagnostics
+    )
+    if parsed is None:
+        if diagnostics.diagnostics:
+            raise diagnostics.diagnostics[0]
+        raise SRUException(SRUDiagnostics.QUERY_SYNTAX_ERROR)
+    return parsed
+
+
+def _get_cql_parser() -> cql.CQLParser:
+    # building the parser tables takes milliseconds, parsing a query only
+    # microseconds; parsers keep state while parsing, so one per thread
+    parser = getattr(_parsers, "cql", None)
+    if parser is None:
+        parser = cql.CQLParser12()
+        parser.build()
+        _parsers.cql = parser
+    return parser
+
+
+def translate_query(
+    query: BatchQuery, number_of_records: int, maximum_records: int
+) -> TranslatedQuery:
+    """Parse and translate a query into a Korp query.
+
+    Args:
+        query: the batch query
+        number_of_records: default number of records
+        maximum_records: maximum number of records
+
+    Returns:
+        TranslatedQuery: the Korp query
+
+    Raises:
+        SRUException: if the query is invalid or not supported
+    """
+    parsed = parse_query(query)
+    # same as `KorpEndpointSearchEngine.search`
+    if isinstance(parsed, CQLQuery):
+        cqp, show, within = cql2cqp(parsed), (), get_cql_within(parsed)
+    else:
+        assert isinstance(parsed, FCSQuery)
+        cqp, show, within = fcs2cqp(parsed), SHOW_ADVANCED, None
+
+    count = query.maximum_records
+    if count is None:
+        count = number_of_records
+    return TranslatedQuery(
+        cqp=cqp,
+        show=tuple(show),
+        within=within,
+        start_record=query.start_record,
+        maximum_records=min(count, maximum_records),
+    )
+
+
+def make_records(kwic: Sequence[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Convert Korp kwic lines into plain keyword-in-context records."""
+    records = []
+    for line in kwic:
+        words = [token["word"] for token in line["tokens"]]
+        match = line["match"]
+        records.append(
+            {
+                "ref": f"{line['corpus']}-{match['position']}",
+                "corpus": line["corpus"],
+                "left": " ".join(words[: match["start"]]),
+                "keyword": " ".join(words[match["start"] : match["end"]]),
+                "right": " ".join(words[match["end"] :]),
+            }
+        )
+    return records
+
+
+def make_diagnostic(ex: SRUException) -> Dict[str, Optional[str]]:
+    uri = getattr(ex.uri, "value", ex.uri)
+    return {"uri": uri, "details": ex.details, "message": str(ex)}
+
+
+# ---------------------------------------------------------------------------
+
+
+class BatchSearch:
+    """Runs batches of queries on a `KorpEndpointSearchEngine`."""
+
+    def __init__(
+        self,
+        engine: "KorpEndpointSearchEngine",
+        number_of_records: int = 250,
+        maximum_records: int = 250,
+        max_queries: int = 100,
+        max_workers: int = 4,
+    ) -> None:
+        """[Constructor]
+
+        Args:
+            engine: the (initialized) search engine
+            number_of_records: default number of records per query
+            maximum_records: maximum number of records per query
+            max_queries: maximum number of queries per batch
+            max_workers: maximum number of concurrent Korp queries per batch
+        """
+        self.engine = engine
+        self.number_of_records = number_of_records
+        self.maximum_records = maximum_records
+        self.max_queries = max_queries
+        self.max_workers = max(1, max_workers)
+
+    def run(self, queries: Sequence[BatchQuery]) -> Iterator[Dict[str, Any]]:
+        """Run a batch of queries.
+
+        Args:
+            queries: the queries
+
+        Returns:
+            Iterator[Dict[str, Any]]: one result per query (with its
+                ``index`` in the batch), in completion order
+        """
+        # translate all, group identical Korp queries
+        pending: Dict[TranslatedQuery, List[int]] = {}
+        for index, query in enumerate(queries):
+            try:
+                translated = translate_query(
+                    query, self.number_of_records, self.maximum_records
+                )
+            except SRUException as ex:
+                yield self._make_result(index, query, diagnostic=make_diagnostic(ex))
+                continue
+            pending.setdefault(translated, []).append(index)
+
+        if not pending:
+            return
+        LOGGER.debug(
+            "Batch of %s queries, %s distinct Korp queries", len(queries), len(pending)
+        )
+
+        executor = ThreadPoolExecutor(
+            max_workers=min(self.max_workers, len(pending)),
+            thread_name_prefix="korp-batch",
+        )
+        not_done: Set[Future] = set()
+        try:
+            futures: Dict[Future, TranslatedQuery] = {
+                executor.submit(
+                    self._search, translated, queries[indexes[0]]
+                ): translated
+                for translated, indexes in pending.items()
+            }
+            not_done = set(futures)
+            while not_done:
+                done, not_done = wait(not_done, return_when=FIRST_COMPLETED)
+                for future in done:
+                    translated = futures[future]
+                    try:
+                        result = future.result()
+                        fields = dict(cqp=translated.cqp, **result)
+                    except SRUException as ex:
+                        fields = dict(diagnostic=make_diagnostic(ex))
+                    except Exception:
+                        LOGGER.exception("Batch query failed: %s", translated.cqp)
+                        fields = dict(
+                            diagnostic=make_diagnostic(
+                                SRUException(SRUDiagnostics.GENERAL_SYSTEM_ERROR)
+                            )
+                        )
+                    for index in pending[translated]:
+                        yield self._make_result(index, queries[index], **fields)
+        finally:
+            # client went away: do not start queued queries
+            # (no ``cancel_futures`` before Python 3.9)
+            for future in not_done:
+                future.cancel()
+            executor.shutdown(wait=False)
+
+    def _search(self, translated: TranslatedQuery, query: BatchQuery) -> Dict[str, Any]:
+        engine = self.engine
+        assert engine.corporaInfo is not None
+        corpora = list(engine.corporaInfo.keys())
+
+        # count only: without a result set no adaptive corpus order is used,
+        # which would only estimate the count
+        count_only = translated.maximum_records == 0
+        rs = None
+        if engine.resultsets is not None and not count_only:
+            rs = engine.resultsets.get_or_create(
+                translated.cqp,
+                corpora,
+                show=translated.show,
+                within=translated.within,
+                source=(query.query_type, query.query),
+            )
+        result, precision = engine.run_query(
+            translated.cqp,
+            corpora,
+            1 if count_only else translated.start_record,
+            # a single record is the least Korp returns (0 means 250 records)
+            1 if count_only else translated.maximum_records,
+            show=translated.show,
+            within=translated.within,
+            rs=rs,
+        )
+        return {
+            "hits": result.get("hits", -1),
+            "precision": SRUResultCountPrecision(precision).value,
+            "resultSetId": rs.handle if rs is not None else None,
+            "records": make_records(
+                result.get("kwic", [])[: translated.maximum_records]
+            ),
+        }
+
+    @staticmethod
+    def _make_result(index: int, query: BatchQuery, **fields: Any) -> Dict[str, Any]:
+        return {
+            "index": index,
+            "query": query.query,
+            "queryType": query.query_type,
+            **fields,
+        }
+
+
+def dump_ndjson(results: Iterator[Dict[str, Any]]) -> Iterator[bytes]:
+    for result in results:
+        yield json.dumps(result, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+# ---------------------------------------------------------------------------
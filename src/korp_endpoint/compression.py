@@ -0,0 +1,217 @@
+"""
+Incremental ``gzip``/``deflate`` response compression (WSGI middleware).
+
+Responses are compressed chunk by chunk, so streamed output is sent on
+as soon as it is produced.
+"""
+
+import logging
+import typing
+import zlib
+from typing import Callable
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from werkzeug.http import parse_accept_header
+
+if typing.TYPE_CHECKING:
+    from _typeshed.wsgi import StartResponse
+    from _typeshed.wsgi import WSGIApplication
+    from _typeshed.wsgi import WSGIEnvironment
+
+
+# ---------------------------------------------------------------------------
+
+
+LOGGER = logging.getLogger(__name__)
+
+ENCODINGS = {
+    # name: zlib wbits
+    "gzip": 16 + zlib.MAX_WBITS,
+    "deflate": zlib.MAX_WBITS,  # zlib format, as per RFC 9110
+}
+"""Supported content codings, in order of preference"""
+
+COMPRESSIBLE_TYPES = (
+    "text/",
+    "application/xml",
+    "application/json",
+    "application/x-ndjson",
+    "application/sru+xml",
+)
+
+# the SRU server sets a (bogus) "Content-Encoding: utf-8" header on all
+# responses, this is not a content coding and will be replaced
+IGNORED_CONTENT_ENCODINGS = frozenset(("identity", "utf-8"))
+
+
+# ---------------------------------------------------------------------------
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Choose a content coding from an ``Accept-Encoding`` header value.
+
+    Args:
+        accept_encoding: the header value
+
+    Returns:
+        Optional[str]: ``gzip``, ``deflate`` or ``None`` for no compression
+    """
+    if not accept_encoding:
+        return None
+    accept = parse_accept_header(accept_encoding)
+    best, best_quality = None, 0.0
+    for encoding in ENCODINGS:
+        quality = accept.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """Compresses responses of the wrapped WSGI application.
+
+    Responses are left untouched if the client does not accept
+    ``gzip``/``deflate``, for ``HEAD`` requests, responses without body,
+    non-text content types, responses that already have a content coding
+    and responses with a ``Content-Length`` below ``min_size``. Responses
+    without ``Content-Length`` (streamed) are always compressed.
+    """
+
+    def __init__(
+        self, app: "WSGIApplication", level: int = 6, min_size: int = 1024
+    ) -> None:
+        """[Constructor]
+
+        Args:
+            app: the WSGI application to wrap
+            level: ``zlib`` compression level (``1`` - ``9``)
+            min_size: minimum response size in bytes to compress
+        """
+        if not 1 <= level <= 9:
+            raise ValueError(f"Invalid compression level: {level}")
+        self.app = app
+        self.level = level
+        self.min_size = max(0, min_size)
+
+    def __call__(
+        self, environ: "WSGIEnvironment", start_response: "StartResponse"
+    ) -> Iterable[bytes]:
+        encoding = None
+        if environ.get("REQUEST_METHOD") != "HEAD":
+            encoding = negotiate_encoding(environ.get("HTTP_ACCEPT_ENCODING"))
+        if encoding is None:
+            return self.app(environ, start_response)
+
+        compressor: List[zlib._Compress] = []
+
+        def _start_response(
+            status: str, headers: List[Tuple[str, str]], exc_info=None
+        ) -> Callable[[bytes], object]:
+            compressor.clear()
+            headers = _add_vary(headers)
+            if self._should_compress(status, headers):
+                headers = [
+                    (name, value)
+                    for name, value in headers
+                    if name.lower() not in ("content-length", "content-encoding")
+                ]
+                headers.append(("Content-Encoding", encoding))
+                headers = _weaken_etag(headers)
+                compressor.append(
+                    zlib.compressobj(self.level, zlib.DEFLATED, ENCODINGS[encoding])
+                )
+            elif status.startswith("304"):
+                # match the validator of the (compressed) full response
+                headers = _weaken_etag(headers)
+            write = start_response(status, headers, exc_info)
+            if not compressor:
+                return write
+
+            def _write(data: bytes) -> object:
+                return write(_compress_chunk(compressor[0], data))
+
+            return _write
+
+        app_iter = self.app(environ, _start_response)
+        if not compressor:
+            return app_iter
+        return self._compress(app_iter, compressor[0])
+
+    def _should_compress(self, status: str, headers: List[Tuple[str, str]]) -> bool:
+        code = int(status.split(None, 1)[0])
+        if code < 200 or code in (204, 206, 304):
+            return False
+
+        content_type = ""
+        for name, value in headers:
+            name = name.lower()
+            if name == "content-encoding":
+                if value.strip().lower() not in IGNORED_CONTENT_ENCODINGS:
+                    return False
+            elif name == "content-length":
+                try:
+                    if int(value) < self.min_size:
+                        return False
+                except ValueError:
+                    return False
+            elif name == "content-type":
+                content_type = value.lower()
+            elif name == "cache-control" and "no-transform" in value.lower():
+                return False
+
+        return content_type.startswith(COMPRESSIBLE_TYPES)
+
+    @staticmethod
+    def _compress(
+        app_iter: Iterable[bytes], compressor: "zlib._Compress"
+    ) -> Iterator[bytes]:
+        try:
+            for chunk in app_iter:
+                if chunk:
+                    yield _compress_chunk(compressor, chunk)
+            yield compressor.flush(zlib.Z_FINISH)
+        finally:
+            close = getattr(app_iter, "close", None)
+            if close is not None:
+                close()
+
+
+# ---------------------------------------------------------------------------
+
+
+def _compress_chunk(compressor: "zlib._Compress", data: bytes) -> bytes:
+    # flush after each chunk, so streamed output is not held back (costs a
+    # few bytes per chunk, buffered responses consist of a single chunk)
+    return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+def _add_vary(headers: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    for i, (name, value) in enumerate(headers):
+        if name.lower() == "vary":
+            fields = [f.strip().lower() for f in value.split(",")]
+            if "accept-encoding" in fields or "*" in fields:
+                return headers
+            headers = list(headers)
+            headers[i] = (name, f"{value}, Accept-Encoding")
+            return headers
+    return list(headers) + [("Vary", "Accept-Encoding")]
+
+
+def _weaken_etag(headers: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    # compressed bytes differ from the identity response, so a strong
+    # validator would be wrong; conditional requests still match weakly
+    return [
+        (
+            (name, f"W/{value}")
+            if name.lower() == "etag" and not value.startswith("W/")
+            else (name, value)
+        )
+        for name, value in headers
+    ]
+
+
+# ---------------------------------------------------------------------------
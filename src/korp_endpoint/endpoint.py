@@ -1,9 +1,19 @@
 import importlib
 import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any
+from typing import Callable
 from typing import Dict
+from typing import Hashable
+from typing import List
 from typing import Optional
+from typing import Sequence
+from typing import Set
+from typing import Tuple
 
+import cql
 from clarin.sru.constants import SRUDiagnostics
 from clarin.sru.constants import SRUResultCountPrecision
 from clarin.sru.diagnostic import SRUDiagnostic
@@ -28,13 +38,32 @@ from clarin.sru.server.result import SRUScanResultSet
 from clarin.sru.server.result import SRUSearchResultSet
 from clarin.sru.xml.writer import SRUXMLStreamWriter
 
+from korp_endpoint.adaptive import CorpusStats
+from korp_endpoint.adaptive import adaptive_query
+from korp_endpoint.batch import QUERY_TYPES
+from korp_endpoint.batch import BatchQuery
+from korp_endpoint.batch import translate_query
 from korp_endpoint.korp import API_BASE_URL
+from korp_endpoint.korp import CONTEXT_SENTENCE
+from korp_endpoint.korp import SHOW_ADVANCED
+from korp_endpoint.korp import ApiBaseUrl
 from korp_endpoint.korp import get_korp_corpus_info
 from korp_endpoint.korp import get_modern_corpora
 from korp_endpoint.korp import make_query
+from korp_endpoint.korp import parse_context
+from korp_endpoint.korp import set_json_decoder
 from korp_endpoint.query_converter import cql2cqp
 from korp_endpoint.query_converter import fcs2cqp
 from korp_endpoint.query_converter import fromSUC
+from korp_endpoint.query_converter import get_cql_within
+from korp_endpoint.resultsets import ResultSet
+from korp_endpoint.resultsets import ResultSetCache
+from korp_endpoint.snapshot import file_key
+from korp_endpoint.snapshot import load_snapshot
+from korp_endpoint.snapshot import store_snapshot
+from korp_endpoint.upstreams import DEFAULT_TIMEOUT
+from korp_endpoint.upstreams import UpstreamPool
+from korp_endpoint.upstreams import parse_upstream_urls
 
 # ---------------------------------------------------------------------------
 
@@ -43,6 +72,21 @@ LOGGER = logging.getLogger(__name__)
 
 RESOURCE_INVENTORY_URL_KEY = "se.gu.spraakbanken.fcs.korp.sru.resourceInventoryURL"
 API_BASE_URL_KEY = "se.gu.spraakbanken.fcs.korp.sru.apiBaseUrl"
+JSON_DECODER_KEY = "se.gu.spraakbanken.fcs.korp.sru.jsonDecoder"
+SNAPSHOT_DIR_KEY = "se.gu.spraakbanken.fcs.korp.sru.snapshotDir"
+CORPUS_INFO_MAX_AGE_KEY = "se.gu.spraakbanken.fcs.korp.sru.corpusInfoMaxAge"
+RESULT_SET_TTL_KEY = "se.gu.spraakbanken.fcs.korp.sru.resultSetTTL"
+RESULT_SET_MAX_KEY = "se.gu.spraakbanken.fcs.korp.sru.resultSetMax"
+RESULT_SET_MAX_KWIC_KEY = "se.gu.spraakbanken.fcs.korp.sru.resultSetMaxKwic"
+ADAPTIVE_CORPUS_ORDER_KEY = "se.gu.spraakbanken.fcs.korp.sru.adaptiveCorpusOrder"
+ADAPTIVE_MAX_RECORDS_KEY = "se.gu.spraakbanken.fcs.korp.sru.adaptiveMaxRecords"
+CONTEXT_KEY = "se.gu.spraakbanken.fcs.korp.sru.context"
+UPSTREAM_AFFINITY_KEY = "se.gu.spraakbanken.fcs.korp.sru.upstreamAffinity"
+UPSTREAM_TIMEOUT_KEY = "se.gu.spraakbanken.fcs.korp.sru.upstreamTimeout"
+UPSTREAM_COOLDOWN_KEY = "se.gu.spraakbanken.fcs.korp.sru.upstreamCooldown"
+
+X_RESULTSET_ID = "x-korp-resultset-id"
+"""Extension parameter to resume a server-side result set"""
 ENDPOINTDESCRIPTION_PACKAGE = "korp_endpoint"
 ENDPOINTDESCRIPTION_FILENAME = "endpoint-description.xml"
 
@@ -63,6 +107,9 @@ class KorpSearchResultSet(SRUSearchResultSet):
         query: str,
         corpora_info: Dict[str, Any],
         request: Optional[SRURequest] = None,
+        resultset_id: Optional[str] = None,
+        resultset_ttl: int = -1,
+        result_count_precision: SRUResultCountPrecision = SRUResultCountPrecision.EXACT,
     ) -> None:
         super().__init__(diagnostics)
         self.config = config
@@ -70,6 +117,9 @@ class KorpSearchResultSet(SRUSearchResultSet):
         self.resultset = resultset
         self.query = query
         self.corpora_info = corpora_info
+        self.resultset_id = resultset_id
+        self.resultset_ttl = resultset_ttl
+        self.result_count_precision = result_count_precision
 
         if request:
             self.start_record = max(1, request.get_start_record())
@@ -96,7 +146,13 @@ class KorpSearchResultSet(SRUSearchResultSet):
         return 0
 
     def get_result_count_precision(self) -> Optional[SRUResultCountPrecision]:
-        return SRUResultCountPrecision.EXACT
+        return self.result_count_precision
+
+    def get_resultSet_id(self) -> Optional[str]:
+        return self.resultset_id
+
+    def get_resultSet_TTL(self) -> int:
+        return self.resultset_ttl
 
     def get_record_schema_identifier(self) -> str:
         if self.request:
@@ -139,6 +195,10 @@ class KorpSearchResultSet(SRUSearchResultSet):
         match = kwic["match"]
         corpus: str = kwic["corpus"]
 
+        # only FCS queries get the Advanced Data View (with pos/lemma layers),
+        # for other queries Korp does not even send those attributes
+        write_adv = self.request is None or self.request.is_query_type(FCSQueryType.FCS)
+
         FCSRecordXMLStreamWriter.startResource(writer, f"{corpus}-{match['position']}")
         FCSRecordXMLStreamWriter.startResourceFragment(writer)
 
@@ -147,13 +207,21 @@ class KorpSearchResultSet(SRUSearchResultSet):
             for i in idxs:
                 end = start + len(tokens[i]["word"])
                 helper.addSpan(wordLayerId, start, end, tokens[i]["word"], **kwargs)
-                try:
+                if write_adv and "msd" in tokens[i]:
+                    try:
+                        helper.addSpan(
+                            posLayerId,
+                            start,
+                            end,
+                            fromSUC(tokens[i]["msd"])[0],
+                            **kwargs,
+                        )
+                    except SRUException:
+                        pass
+                if write_adv and "lemma" in tokens[i]:
                     helper.addSpan(
-                        posLayerId, start, end, fromSUC(tokens[i]["msd"])[0], **kwargs
+                        lemmaLayerId, start, end, tokens[i]["lemma"], **kwargs
                     )
-                except SRUException:
-                    pass
-                helper.addSpan(lemmaLayerId, start, end, tokens[i]["lemma"], **kwargs)
                 start = end + 1
             return start
 
@@ -169,7 +237,7 @@ class KorpSearchResultSet(SRUSearchResultSet):
             _add_spans(range(match["end"], len(tokens)), start=start)
 
         helper.writeHitsDataView(writer, wordLayerId)
-        if self.request is None or self.request.is_query_type(FCSQueryType.FCS):
+        if write_adv:
             helper.writeAdvancedDataView(writer)
 
         FCSRecordXMLStreamWriter.endResourceFragment(writer)
@@ -180,12 +248,94 @@ class KorpSearchResultSet(SRUSearchResultSet):
 
 
 class KorpEndpointSearchEngine(SimpleEndpointSearchEngineBase):
-    """A Korp CLARIN FCS 2.0 endpoint example search engine."""
+    """A Korp CLARIN FCS 2.0 endpoint example search engine.
+
+    After `do_init`, the engine may be used by concurrent requests (e.g.
+    gunicorn ``gthread`` workers): configuration and corpus info are only
+    read, caches and statistics are guarded by locks, and Korp requests
+    use a session per thread (see `korp.get_session`).
+    """
 
     def __init__(self) -> None:
         super().__init__()
         self.corporaInfo: Optional[Dict[str, Any]] = None
-        self.api_base_url: str = API_BASE_URL
+        self.api_base_url: ApiBaseUrl = API_BASE_URL
+        self.timeout: Optional[float] = DEFAULT_TIMEOUT
+        self.context: str = CONTEXT_SENTENCE
+        self.corpora_info_version = 0
+        self.resultsets: Optional[ResultSetCache] = None
+        self.corpus_stats: Optional[CorpusStats] = None
+        self.adaptive_max_records = 0
+        self._fill_executor: Optional[ThreadPoolExecutor] = None
+        self._filling: Set[str] = set()
+        self._filling_lock = threading.Lock()
+        self.snapshot_dir: Optional[str] = None
+        self.endpoint_description_source: Optional[
+            Tuple[str, Callable[[], EndpointDescription]]
+        ] = None
+        self.endpoint_description_key: Optional[Hashable] = None
+        self._refresh_lock = threading.Lock()
+
+    def _load_EndpointDescription_snapshot(
+        self, filename: str, loader: Callable[[], EndpointDescription]
+    ) -> Tuple[EndpointDescription, Optional[Hashable]]:
+        try:
+            key = file_key(filename)
+        except OSError:
+            key = None
+
+        self.endpoint_description_source = (filename, loader)
+
+        if not self.snapshot_dir or key is None:
+            ed = loader()
+        else:
+            ed = load_snapshot(self.snapshot_dir, "endpoint-description", key)
+            if ed is None:
+                ed = loader()
+                store_snapshot(self.snapshot_dir, "endpoint-description", key, ed)
+        return ed, key
+
+    def refresh_EndpointDescription(self) -> bool:
+        """Reload the endpoint description if its source file changed.
+
+        Returns:
+            bool: ``True`` if the endpoint description was reloaded
+        """
+        if self.endpoint_description_source is None:
+            return False
+        filename, loader = self.endpoint_description_source
+        try:
+            key = file_key(filename)
+        except OSError:
+            return False
+        if key == self.endpoint_description_key:
+            return False
+
+        with self._refresh_lock:
+            # another thread might have reloaded it meanwhile
+            if key == self.endpoint_description_key:
+                return False
+            LOGGER.info("Reloading changed endpoint description '%s'", filename)
+            # NOTE: the old one may still be in use by concurrent requests, so
+            # it will not be destroyed but left to the garbage collector
+            ed, key = self._load_EndpointDescription_snapshot(filename, loader)
+            # key last, a concurrent `get_explain_version` must not see the
+            # new key together with the old endpoint description
+            self.endpoint_description = ed
+            self.endpoint_description_key = key
+        return True
+
+    def get_explain_version(self) -> Hashable:
+        """Get a version token for content rendered in ``explain``
+        responses. It changes whenever the endpoint description file
+        changes. The corpus info is only loaded in `do_init`, so it does
+        not change while the endpoint is running.
+
+        Returns:
+            Hashable: the version token
+        """
+        self.refresh_EndpointDescription()
+        return (self.endpoint_description_key, self.corpora_info_version)
 
     def _load_bundled_EndpointDescription(self) -> EndpointDescription:
         if not importlib.resources.is_resource(
@@ -212,10 +362,40 @@ class KorpEndpointSearchEngine(SimpleEndpointSearchEngineBase):
         riu = params.get(RESOURCE_INVENTORY_URL_KEY)
         if riu is None or riu.isspace():
             LOGGER.debug("Using bundled 'endpoint-description.xml' file")
-            return self._load_bundled_EndpointDescription()
+            ed, key = self._load_EndpointDescription_snapshot(
+                os.path.join(os.path.dirname(__file__), ENDPOINTDESCRIPTION_FILENAME),
+                self._load_bundled_EndpointDescription,
+            )
         else:
             LOGGER.debug("Using external file '%s'", riu)
-            return SimpleEndpointDescriptionParser.parse(riu)
+            ed, key = self._load_EndpointDescription_snapshot(
+                riu, lambda: SimpleEndpointDescriptionParser.parse(riu)
+            )
+        self.endpoint_description_key = key
+        return ed
+
+    def _load_corpora_info(self, max_age: float) -> Optional[Dict[str, Any]]:
+        if isinstance(self.api_base_url, UpstreamPool):
+            key = tuple(self.api_base_url.urls)
+        else:
+            key = (self.api_base_url,)
+        if self.snapshot_dir:
+            corpora_info = load_snapshot(
+                self.snapshot_dir, "corpora-info", key, max_age=max_age
+            )
+            if corpora_info is not None:
+                return corpora_info
+
+        open_corpora = get_modern_corpora(
+            api_base_url=self.api_base_url, timeout=self.timeout
+        )
+        corpora_info = get_korp_corpus_info(
+            open_corpora, api_base_url=self.api_base_url, timeout=self.timeout
+        )
+
+        if self.snapshot_dir and corpora_info is not None:
+            store_snapshot(self.snapshot_dir, "corpora-info", key, corpora_info)
+        return corpora_info
 
     def do_init(
         self,
@@ -225,21 +405,96 @@ class KorpEndpointSearchEngine(SimpleEndpointSearchEngineBase):
     ) -> None:
         LOGGER.info("KorpEndpointSearchEngine.doInit %s", config.port)
 
+        # request timeout, both for a single Korp API and for mirrors
+        timeout = self._parse_int(
+            params.get(UPSTREAM_TIMEOUT_KEY), int(DEFAULT_TIMEOUT)
+        )
+        self.timeout = timeout if timeout > 0 else None
+
         abu = params.get(API_BASE_URL_KEY)
         if abu is not None and not abu.isspace():
-            self.api_base_url = abu
+            urls = parse_upstream_urls(abu)
+            if len(urls) == 1:
+                self.api_base_url = urls[0]
+            else:
+                self.api_base_url = UpstreamPool(
+                    urls,
+                    cooldown=self._parse_int(params.get(UPSTREAM_COOLDOWN_KEY), 30),
+                    affinity=self._parse_bool(params.get(UPSTREAM_AFFINITY_KEY)),
+                    timeout=self.timeout,
+                )
         LOGGER.debug("Korp API base url: %s", self.api_base_url)
 
-        open_corpora = get_modern_corpora(api_base_url=self.api_base_url)
-        self.corporaInfo = get_korp_corpus_info(
-            open_corpora, api_base_url=self.api_base_url
-        )
+        # unset: keep a decoder set by an embedding application, else the
+        # fastest installed one is chosen on first use
+        jd = params.get(JSON_DECODER_KEY)
+        if jd is not None and not jd.isspace():
+            try:
+                set_json_decoder(jd.strip())
+            except ValueError as ex:
+                raise SRUConfigException(f"Invalid JSON decoder: {ex}") from ex
+
+        ctx = params.get(CONTEXT_KEY)
+        if ctx is not None and not ctx.isspace():
+            try:
+                self.context = parse_context(ctx)
+            except ValueError as ex:
+                raise SRUConfigException(str(ex)) from ex
+        LOGGER.debug("Korp context: %s", self.context)
+
+        sd = params.get(SNAPSHOT_DIR_KEY)
+        if sd is not None and not sd.isspace():
+            self.snapshot_dir = sd.strip()
+            LOGGER.debug("Using startup snapshots in: %s", self.snapshot_dir)
+        max_age = self._parse_int(params.get(CORPUS_INFO_MAX_AGE_KEY), 24 * 60 * 60)
+
+        rs_ttl = self._parse_int(params.get(RESULT_SET_TTL_KEY), 300)
+        if rs_ttl > 0:
+            rs_max = self._parse_int(params.get(RESULT_SET_MAX_KEY), 64)
+            rs_kwic = self._parse_int(params.get(RESULT_SET_MAX_KWIC_KEY), 10000)
+            LOGGER.debug(
+                "Result sets: max %s (%s kwic lines) with TTL %ss",
+                rs_max,
+                rs_kwic,
+                rs_ttl,
+            )
+            self.resultsets = ResultSetCache(
+                ttl=rs_ttl,
+                max_entries=rs_max,
+                max_kwic=min(5000, rs_kwic),
+                max_total_kwic=rs_kwic,
+            )
+
+        self.corporaInfo = self._load_corpora_info(max_age)
+        self.corpora_info_version += 1
         if self.corporaInfo is None:
             raise SRUException(
                 SRUDiagnostics.GENERAL_SYSTEM_ERROR,
                 message="Error querying korp corpus info",
             )
 
+        if self._parse_bool(params.get(ADAPTIVE_CORPUS_ORDER_KEY)):
+            self.adaptive_max_records = self._parse_int(
+                params.get(ADAPTIVE_MAX_RECORDS_KEY), 50
+            )
+            LOGGER.debug(
+                "Adaptive corpus order for up to %s records",
+                self.adaptive_max_records,
+            )
+            self.corpus_stats = CorpusStats(self.corporaInfo)
+
+    def wait_for_background_tasks(self) -> None:
+        """Wait for running result set fills and stop their threads, e.g.
+        before forking workers (threads do not survive forking)."""
+        with self._filling_lock:
+            executor, self._fill_executor = self._fill_executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def do_destroy(self) -> None:
+        if self._fill_executor is not None:
+            self._fill_executor.shutdown(wait=False)
+
     # ----------------------------------------------------
 
     def do_scan(
@@ -256,20 +511,328 @@ class KorpEndpointSearchEngine(SimpleEndpointSearchEngineBase):
         request: SRURequest,
         diagnostics: SRUDiagnosticList,
     ) -> SRUSearchResultSet:
-        # translate query
-        query: str
+        # resume a server-side result set or translate query
+        rs: Optional[ResultSet] = None
+        rs_id = self._get_requested_resultset_id(request)
+        if rs_id is not None:
+            if self.resultsets is None:
+                raise SRUException(SRUDiagnostics.RESULT_SETS_NOT_SUPPORTED)
+            # result sets are per worker process, the request may arrive
+            # at another worker or after the result set expired
+            rs = self.resultsets.get(ResultSetCache.parse_handle(rs_id)[0])
+            if rs is None:
+                rs = self._restore_resultset(rs_id)
+            if rs is None and self._get_resultset_query_id(request) is not None:
+                raise SRUException(
+                    SRUDiagnostics.RESULT_SET_DOES_NOT_EXIST,
+                    rs_id,
+                    message=f"Result set '{rs_id}' does not exist or has expired.",
+                )
+            if rs is None:
+                LOGGER.debug("Result set %s not found, running the query", rs_id)
+
+        if rs is not None:
+            query = rs.query
+            corpora2query = list(rs.corpora)
+            show = rs.show
+            within = rs.within
+        else:
+            query = self._translate_query(request)
+            show = self._get_show_attributes(request)
+            within = self._get_within(request)
+
+            # check fcs context (corpus)
+            assert self.corporaInfo is not None
+            corpora2query = list(self.corporaInfo.keys())
+
+            # if X_FCS_CONTEXT in request.get_extra_request_data_names():
+            #     corpus = request.get_extra_request_data(X_FCS_CONTEXT)
+            #     if corpus is not None and not corpus.isspace():
+            #         # hdl%3A10794%2Fsbmoderna (default) ?
+            #         LOGGER.info("Loading specific corpus data: '{}'", corpus)
+            #         corpora2query = [corpus]
+
+            # TODO: map pid/handle to Korp corpusname
+
+            if self.resultsets is not None:
+                ttl = request.get_resultSet_TTL()
+                rs = self.resultsets.get_or_create(
+                    query,
+                    corpora2query,
+                    ttl=min(ttl, self.resultsets.ttl) if ttl > 0 else None,
+                    show=show,
+                    within=within,
+                    source=(request.get_query_type(), request.get_query_raw()),
+                )
+
+        result, precision = self.run_query(
+            query,
+            corpora2query,
+            request.get_start_record(),
+            request.get_maximum_records(),
+            show=show,
+            within=within,
+            rs=rs,
+        )
+
+        return KorpSearchResultSet(
+            config=config,
+            diagnostics=diagnostics,
+            resultset=result,
+            query=query,
+            corpora_info=self.corporaInfo,
+            request=request,
+            resultset_id=rs.handle if rs is not None else None,
+            resultset_ttl=rs.ttl if rs is not None else -1,
+            result_count_precision=precision,
+        )
+
+    def run_query(
+        self,
+        query: str,
+        corpora: List[str],
+        start_record: int,
+        maximum_records: int,
+        show: Sequence[str] = (),
+        within: Optional[str] = None,
+        rs: Optional[ResultSet] = None,
+    ) -> Tuple[Dict[str, Any], SRUResultCountPrecision]:
+        """Run a translated query, serving from and updating the result set.
+
+        Args:
+            query: the CQP query
+            corpora: the Korp corpora to search
+            start_record: 1-based position of the first record
+            maximum_records: number of records
+            show: positional attributes for Korp
+            within: structure that matches must lie within
+            rs: the result set of the query (if enabled)
+
+        Returns:
+            Tuple[Dict[str, Any], SRUResultCountPrecision]: the Korp(-like)
+                result (``hits``, ``kwic``) and the precision of ``hits``
+
+        Raises:
+            SRUException: if the query execution failed
+        """
+        # serve from already fetched windows
+        result: Optional[Dict[str, Any]] = None
+        precision = SRUResultCountPrecision.EXACT
+        start = max(0, start_record - 1)
+        if rs is not None:
+            with rs.lock:
+                kwic = rs.get_kwic(start, maximum_records)
+                if kwic is not None:
+                    LOGGER.debug("Serving records from result set %s", rs.id)
+                    result = {"hits": rs.hits, "kwic": kwic}
+                    precision = rs.precision
+
+        # search most productive corpora first, stop early
+        if result is None and self._is_adaptive_search(
+            start_record, maximum_records, rs
+        ):
+            assert rs is not None
+            found = self._adaptive_search(query, show, within, maximum_records, rs)
+            if found is not None:
+                result, precision = found
+
+        # continue in the adaptive corpus order of the result set
+        if result is None and rs is not None and rs.segments is not None:
+            result, precision = self._segmented_search(rs, start, maximum_records)
+
+        # perform search
+        if result is None:
+            result = make_query(
+                query,
+                corpora,
+                start_record,
+                maximum_records,
+                api_base_url=self.api_base_url,
+                timeout=self.timeout,
+                query_data=rs.query_data if rs is not None else None,
+                show=show,
+                context=self.context,
+                within=within,
+            )
+            if result is None:
+                raise SRUException(
+                    SRUDiagnostics.CANNOT_PROCESS_QUERY_REASON_UNKNOWN,
+                    "The query execution failed by this CLARIN-FCS Endpoint.",
+                )
+            if rs is not None and self.resultsets is not None:
+                with rs.lock:
+                    # a concurrent adaptive search may have fixed the order
+                    if rs.segments is None:
+                        rs.update(result, start)
+                self.resultsets.trim(rs)
+            if self.corpus_stats is not None and "corpus_hits" in result:
+                self.corpus_stats.update(result["corpus_hits"])
+
+        return result, precision
+
+    def _is_adaptive_search(
+        self, start_record: int, maximum_records: int, rs: Optional[ResultSet]
+    ) -> bool:
+        if self.corpus_stats is None:
+            return False
+        if start_record > 1:
+            return False
+        if not 0 < maximum_records <= self.adaptive_max_records:
+            return False
+        # the result set keeps the corpus order for the following pages,
+        # without one they would not continue the first page
+        if rs is None:
+            return False
+        with rs.lock:
+            return rs.is_new
+
+    def _adaptive_search(
+        self,
+        query: str,
+        show: Sequence[str],
+        within: Optional[str],
+        count: int,
+        rs: ResultSet,
+    ) -> Optional[Tuple[Dict[str, Any], SRUResultCountPrecision]]:
+        assert self.corpus_stats is not None
+
+        found = adaptive_query(
+            rs.corpora,
+            count,
+            self.corpus_stats,
+            lambda batch, n: make_query(
+                query,
+                batch,
+                1,
+                n,
+                api_base_url=self.api_base_url,
+                timeout=self.timeout,
+                show=show,
+                context=self.context,
+                within=within,
+            ),
+        )
+        if found is None:
+            return None
+        result, precision = found
+        segments = result.pop("batches")
+        self.corpus_stats.update(result["corpus_hits"])
+
+        with rs.lock:
+            if not rs.is_new:
+                # a concurrent request was first, follow its order
+                return None
+            rs.segments = segments
+            rs.hits = result["hits"]
+            rs.precision = precision
+            if result["kwic"]:
+                rs.windows[0] = result["kwic"]
+        if precision != SRUResultCountPrecision.EXACT:
+            self._schedule_fill(rs)
+
+        return result, precision
+
+    def _segmented_search(
+        self, rs: ResultSet, start: int, count: int
+    ) -> Tuple[Dict[str, Any], SRUResultCountPrecision]:
+        # records are ordered segment by segment, so query the segments
+        # that overlap the requested window, with offsets inside them
+        assert rs.segments is not None
+        kwic: List[Dict[str, Any]] = []
+        offset = 0
+        for index, (corpora, hits) in enumerate(list(rs.segments)):
+            if len(kwic) >= count:
+                break
+            position = start + len(kwic)
+            if 0 <= hits <= position - offset:
+                offset += max(0, hits)
+                continue
+            result = make_query(
+                rs.query,
+                list(corpora),
+                position - offset + 1,
+                count - len(kwic),
+                api_base_url=self.api_base_url,
+                timeout=self.timeout,
+                show=rs.show,
+                context=self.context,
+                within=rs.within,
+            )
+            if result is None or "hits" not in result:
+                raise SRUException(
+                    SRUDiagnostics.CANNOT_PROCESS_QUERY_REASON_UNKNOWN,
+                    "The query execution failed by this CLARIN-FCS Endpoint.",
+                )
+            kwic.extend(result.get("kwic", []))
+            offset += result["hits"]
+            rs.set_segment_hits(index, result["hits"])
+            if self.corpus_stats is not None and "corpus_hits" in result:
+                self.corpus_stats.update(result["corpus_hits"])
+
+        with rs.lock:
+            if kwic:
+                rs.windows[start] = kwic
+            hits, precision = rs.hits, rs.precision
+        if self.resultsets is not None:
+            self.resultsets.trim(rs)
+        return {"hits": hits, "kwic": kwic}, precision
+
+    def _schedule_fill(self, rs: ResultSet) -> None:
+        with self._filling_lock:
+            if rs.id in self._filling:
+                return
+            self._filling.add(rs.id)
+            if self._fill_executor is None:
+                # lazy, threads do not survive forking (gunicorn --preload)
+                self._fill_executor = ThreadPoolExecutor(
+                    max_workers=2, thread_name_prefix="korp-fill"
+                )
+            # submit while holding the lock, the executor may be shut down
+            # concurrently by `wait_for_background_tasks`
+            self._fill_executor.submit(self._fill_resultset, rs)
+
+    def _fill_resultset(self, rs: ResultSet) -> None:
+        try:
+            LOGGER.debug("Filling in total count for result set %s", rs.id)
+            assert rs.segments is not None
+            for index, (corpora, hits) in enumerate(list(rs.segments)):
+                if hits >= 0:
+                    continue
+                result = make_query(
+                    rs.query,
+                    list(corpora),
+                    1,
+                    1,
+                    api_base_url=self.api_base_url,
+                    timeout=self.timeout,
+                    show=rs.show,
+                    context=self.context,
+                    within=rs.within,
+                )
+                if result is None or "hits" not in result:
+                    return
+                rs.set_segment_hits(index, result["hits"])
+                if self.corpus_stats is not None and "corpus_hits" in result:
+                    self.corpus_stats.update(result["corpus_hits"])
+        except Exception:
+            LOGGER.exception("Error filling in result set %s", rs.id)
+        finally:
+            with self._filling_lock:
+                self._filling.discard(rs.id)
+
+    def _translate_query(self, request: SRURequest) -> str:
         if request.is_query_type(FCSQueryType.CQL):
             # Got a CQL query (either SRU 1.1 or higher).
             # Translate to a proper CQP query ...
             query_in: SRUQuery = request.get_query()
             assert isinstance(query_in, CQLQuery)
-            query = cql2cqp(query_in)
+            return cql2cqp(query_in)
         elif request.is_query_type(FCSQueryType.FCS):
             # Got a FCS query (SRU 2.0).
             # Translate to a proper CQP query
             query_in: SRUQuery = request.get_query()
             assert isinstance(query_in, FCSQuery)
-            query = fcs2cqp(query_in)
+            return fcs2cqp(query_in)
         else:
             # Got something else we don't support. Send error ...
             raise SRUException(
@@ -277,40 +840,62 @@ class KorpEndpointSearchEngine(SimpleEndpointSearchEngineBase):
                 f"Queries with queryType '{request.get_query_type()}' are not supported by this CLARIN-FCS Endpoint.",
             )
 
-        # check fcs context (corpus)
-        assert self.corporaInfo is not None
-        corpora2query = list(self.corporaInfo.keys())
+    def _get_within(self, request: SRURequest) -> Optional[str]:
+        if request.is_query_type(FCSQueryType.CQL):
+            query_in = request.get_query()
+            assert isinstance(query_in, CQLQuery)
+            return get_cql_within(query_in)
+        return None
 
-        # if X_FCS_CONTEXT in request.get_extra_request_data_names():
-        #     corpus = request.get_extra_request_data(X_FCS_CONTEXT)
-        #     if corpus is not None and not corpus.isspace():
-        #         # hdl%3A10794%2Fsbmoderna (default) ?
-        #         LOGGER.info("Loading specific corpus data: '{}'", corpus)
-        #         corpora2query = [corpus]
+    def _get_show_attributes(self, request: SRURequest) -> Sequence[str]:
+        # only the Advanced Data View (FCS queries) renders msd/lemma
+        if request.is_query_type(FCSQueryType.FCS):
+            return SHOW_ADVANCED
+        return ()
+
+    def _restore_resultset(self, rs_id: str) -> Optional[ResultSet]:
+        # rebuild from the original query in the handle; it is translated
+        # again, so a handle cannot smuggle in arbitrary CQP
+        assert self.resultsets is not None and self.corporaInfo is not None
+        source = ResultSetCache.parse_handle(rs_id)[1]
+        if source is None or source[0] not in QUERY_TYPES:
+            return None
+        try:
+            translated = translate_query(BatchQuery(source[1], source[0]), 1, 1)
+        except SRUException as ex:
+            LOGGER.debug("Cannot restore result set %s: %s", rs_id, ex)
+            return None
+        LOGGER.debug("Restoring result set %s", rs_id)
+        return self.resultsets.get_or_create(
+            translated.cqp,
+            list(self.corporaInfo.keys()),
+            show=translated.show,
+            within=translated.within,
+            source=source,
+        )
 
-        # TODO: map pid/handle to Korp corpusname
+    def _get_requested_resultset_id(self, request: SRURequest) -> Optional[str]:
+        # extension parameter
+        rs_id = request.get_extra_request_data(X_RESULTSET_ID)
+        if rs_id is not None and not rs_id.isspace():
+            return rs_id.strip()
 
-        # perform search
-        result = make_query(
-            query,
-            corpora2query,
-            request.get_start_record(),
-            request.get_maximum_records(),
-            api_base_url=self.api_base_url,
-        )
-        if result is None:
-            raise SRUException(
-                SRUDiagnostics.CANNOT_PROCESS_QUERY_REASON_UNKNOWN,
-                "The query execution failed by this CLARIN-FCS Endpoint.",
-            )
-        return KorpSearchResultSet(
-            config=config,
-            diagnostics=diagnostics,
-            resultset=result,
-            query=query,
-            corpora_info=self.corporaInfo,
-            request=request,
-        )
+        return self._get_resultset_query_id(request)
+
+    def _get_resultset_query_id(self, request: SRURequest) -> Optional[str]:
+        # SRU style: query = 'cql.resultSetId = "<id>"'
+        if request.is_query_type(FCSQueryType.CQL):
+            query_in = request.get_query()
+            assert isinstance(query_in, CQLQuery)
+            node = query_in.parsed_query.root
+            if (
+                isinstance(node, cql.parser.CQLSearchClause)
+                and node.index is not None
+                and node.index.name.lower() == "cql.resultsetid"
+            ):
+                return node.term
+
+        return None
 
     # ----------------------------------------------------
 
@@ -0,0 +1,33 @@
+"""
+Gunicorn settings for the Korp endpoint, configured by environment variables.
+
+Usage::
+
+    gunicorn --config python:korp_endpoint.gunicorn_config \
+        --preload "korp_endpoint.app:make_gunicorn_app()"
+
+* ``GUNICORN_NUM_WORKERS``: number of worker processes (default ``2``)
+* ``GUNICORN_NUM_THREADS``: number of threads per worker (default ``1``),
+  more than one selects the threaded ``gthread`` worker class
+* ``GUNICORN_WORKER_CLASS``: override the worker class
+* ``GUNICORN_TIMEOUT``: worker timeout in seconds (default ``30``)
+
+Threads of a worker share its result sets, corpus statistics and Korp
+connections. Requests mostly wait for Korp, so threads let a few worker
+processes serve many concurrent requests.
+"""
+
+import os
+
+# ---------------------------------------------------------------------------
+
+
+workers = int(os.environ.get("GUNICORN_NUM_WORKERS", "2"))
+threads = int(os.environ.get("GUNICORN_NUM_THREADS", "1"))
+worker_class = os.environ.get(
+    "GUNICORN_WORKER_CLASS", "gthread" if threads > 1 else "sync"
+)
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
+
+
+# ---------------------------------------------------------------------------
@@ -1,13 +1,26 @@
+import json
 import logging
+import os
+import threading
+import time
+import typing
 from typing import Any
+from typing import Callable
 from typing import Dict
 from typing import List
 from typing import Optional
+from typing import Sequence
 from typing import Set
 from typing import Union
 from urllib.parse import quote_plus
 
-import requests
+from korp_endpoint.upstreams import DEFAULT_TIMEOUT
+from korp_endpoint.upstreams import Upstream
+from korp_endpoint.upstreams import UpstreamPool
+
+if typing.TYPE_CHECKING:
+    import requests
+    import requests.adapters
 
 # ---------------------------------------------------------------------------
 
@@ -15,6 +28,12 @@ import requests
 LOGGER = logging.getLogger(__name__)
 
 API_BASE_URL = "https://ws.spraakbanken.gu.se/ws/korp/v6/"
+SHOW_ADVANCED = ("msd", "lemma")
+"""Positional attributes (besides ``word``) for the Advanced Data View"""
+CONTEXT_SENTENCE = "1 sentence"
+HTTP_POOL_SIZE = 16
+"""Maximum number of kept-alive connections per Korp host (per process),
+should be at least the number of threads per worker"""
 MODERN_CORPORA = [
     "ABOUNDERRATTELSER2012",
     "ABOUNDERRATTELSER2013",
@@ -145,22 +164,248 @@ MODERN_CORPORA = [
 # ---------------------------------------------------------------------------
 
 
-def get_korp_info(api_base_url: str = API_BASE_URL) -> Optional[Dict[str, Any]]:
+JSONDecoder = Callable[[bytes], Any]
+"""Decodes a raw (UTF-8 encoded) JSON response body."""
+
+JSON_DECODERS = ("orjson", "msgspec", "ujson", "json")
+"""Known JSON decoder names, in order of preference."""
+
+_json_decoder: Optional[JSONDecoder] = None
+
+
+def load_json_decoder(name: str) -> Optional[JSONDecoder]:
+    """Load a JSON decoder by name.
+
+    Args:
+        name: one of `JSON_DECODERS`
+
+    Returns:
+        JSONDecoder: the decoder function or ``None`` if the library
+            is not installed
+
+    Raises:
+        ValueError: if the decoder name is unknown
+    """
+    if name == "orjson":
+        try:
+            import orjson
+        except ImportError:
+            return None
+        return orjson.loads
+    if name == "msgspec":
+        try:
+            import msgspec.json
+        except ImportError:
+            return None
+        return msgspec.json.Decoder().decode
+    if name == "ujson":
+        try:
+            import ujson
+        except ImportError:
+            return None
+        return ujson.loads
+    if name == "json":
+        return json.loads
+    raise ValueError(f"Unknown JSON decoder: {name}")
+
+
+def get_json_decoder() -> JSONDecoder:
+    """Get the JSON decoder for Korp responses. If none has been set,
+    the first available decoder of `JSON_DECODERS` will be used."""
+    if _json_decoder is None:
+        set_json_decoder(None)
+    assert _json_decoder is not None
+    return _json_decoder
+
+
+def set_json_decoder(decoder: Union[str, JSONDecoder, None]) -> None:
+    """Set the JSON decoder for Korp responses.
+
+    Args:
+        decoder: a decoder name (see `JSON_DECODERS`), a custom decoder
+            function or ``None`` to use the fastest available decoder
+
+    Raises:
+        ValueError: if the named decoder is unknown or not installed
+    """
+    global _json_decoder
+    if callable(decoder):
+        _json_decoder = decoder
+        return
+
+    if decoder is not None:
+        found = load_json_decoder(decoder)
+        if found is None:
+            raise ValueError(f"JSON decoder '{decoder}' is not installed")
+        LOGGER.debug("Using JSON decoder: %s", decoder)
+        _json_decoder = found
+        return
+
+    for name in JSON_DECODERS:
+        found = load_json_decoder(name)
+        if found is not None:
+            LOGGER.debug("Using JSON decoder: %s", name)
+            _json_decoder = found
+            return
+
+
+ApiBaseUrl = Union[str, UpstreamPool]
+"""A single Korp API base URL or a pool of mirrors."""
+
+
+_sessions = threading.local()
+_adapter: Optional["requests.adapters.HTTPAdapter"] = None
+_adapter_lock = threading.Lock()
+
+
+def get_session() -> "requests.Session":
+    """Get the HTTP session of the current thread.
+
+    `requests.Session` is not documented to be thread-safe, so each thread
+    gets its own session, but all sessions share one connection pool that
+    keeps (keep-alive) connections to Korp across requests and threads.
+    """
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        import requests
+
+        session = requests.Session()
+        adapter = _get_adapter()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _sessions.session = session
+    return session
+
+
+def _get_adapter() -> "requests.adapters.HTTPAdapter":
+    global _adapter
+    with _adapter_lock:
+        if _adapter is None:
+            from requests.adapters import HTTPAdapter
+
+            # urllib3 connection pools are thread-safe
+            _adapter = HTTPAdapter(pool_maxsize=HTTP_POOL_SIZE)
+        return _adapter
+
+
+def _reset_sessions() -> None:
+    # after fork (e.g. gunicorn --preload): connections opened by the parent
+    # must not be shared, and the lock may have been held by another thread
+    global _sessions, _adapter, _adapter_lock
+    _sessions = threading.local()
+    _adapter = None
+    _adapter_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_sessions)
+
+
+def _request(
+    api_base_url: ApiBaseUrl,
+    query_string: str,
+    data: Optional[Dict[str, str]] = None,
+    affinity: Optional[str] = None,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+) -> "requests.Response":
+    import requests  # lazy, keeps worker startup fast
+
+    session = get_session()
+    method = "POST" if data is not None else "GET"
+    if not isinstance(api_base_url, UpstreamPool):
+        return session.request(
+            method, f"{api_base_url}?{query_string}", data=data, timeout=timeout
+        )
+
+    pool = api_base_url
+    tried: List[Upstream] = []
+    while True:
+        upstream = pool.choose(affinity, exclude=tried)
+        tried.append(upstream)
+        start = time.perf_counter()
+        ok = False
+        try:
+            resp = session.request(
+                method,
+                f"{upstream.url}?{query_string}",
+                data=data,
+                timeout=pool.timeout,
+            )
+            # client errors (e.g. invalid CQP) are not the upstream's fault
+            ok = resp.status_code < 500
+        except requests.exceptions.RequestException as ex:
+            # connection errors, timeouts, truncated or undecodable bodies, ...
+            if len(tried) >= pool.max_attempts:
+                raise
+            LOGGER.warning("Korp upstream %s failed (%s), retrying", upstream.url, ex)
+            continue
+        finally:
+            # exactly one report for each choice, else `inflight` never drops
+            pool.report(upstream, time.perf_counter() - start, ok=ok)
+
+        if ok or len(tried) >= pool.max_attempts:
+            return resp
+        LOGGER.warning(
+            "Korp upstream %s responded with %s, retrying",
+            upstream.url,
+            resp.status_code,
+        )
+
+
+def _decode_json(resp: "requests.Response") -> Any:
+    # decode raw bytes, skips charset detection and str conversion
+    return get_json_decoder()(resp.content)
+
+
+def parse_context(value: str) -> str:
+    """Parse a context configuration value into a Korp context.
+
+    Args:
+        value: ``sentence``, a number of tokens (on each side of the
+            match) or ``none``
+
+    Returns:
+        str: the Korp ``defaultcontext`` value
+
+    Raises:
+        ValueError: if the value is invalid
+    """
+    value = value.strip().lower()
+    if value == "sentence":
+        return CONTEXT_SENTENCE
+    if value == "none":
+        return "0 words"
+    if value.isdigit():
+        return f"{int(value)} words"
+    raise ValueError(f"Invalid context: {value}")
+
+
+# ---------------------------------------------------------------------------
+
+
+def get_korp_info(
+    api_base_url: ApiBaseUrl = API_BASE_URL,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+) -> Optional[Dict[str, Any]]:
     cmd = "command=info"
-    url = f"{api_base_url}?{cmd}"
+
+    import requests  # lazy, keeps worker startup fast
+
     try:
-        resp = requests.get(url)
+        resp = _request(api_base_url, cmd, timeout=timeout)
         resp.raise_for_status()
-        return resp.json()
-    except requests.exceptions.HTTPError as ex:
+        return _decode_json(resp)
+    except requests.exceptions.RequestException as ex:
         LOGGER.error("Korp Info Error: %s", ex)
-    except requests.exceptions.JSONDecodeError as ex:
+    except ValueError as ex:
         LOGGER.error("Korp Info Error: %s", ex)
     return None
 
 
 def get_korp_corpus_info(
-    corpora_names: Union[str, List[str]], api_base_url: str = API_BASE_URL
+    corpora_names: Union[str, List[str]],
+    api_base_url: ApiBaseUrl = API_BASE_URL,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
 ) -> Optional[Dict[str, Any]]:
     if not corpora_names:
         return None
@@ -169,21 +414,26 @@ def get_korp_corpus_info(
     corpora_names = ",".join(corpora_names)
 
     cmd = "command=info&corpus="
-    url = f"{api_base_url}?{cmd}{corpora_names}"
+
+    import requests
+
     try:
-        resp = requests.get(url)
+        resp = _request(api_base_url, f"{cmd}{corpora_names}", timeout=timeout)
         resp.raise_for_status()
-        result = resp.json()
+        result = _decode_json(resp)
         return result["corpora"]
-    except requests.exceptions.HTTPError as ex:
+    except requests.exceptions.RequestException as ex:
         LOGGER.error("Korp Corpus Info Error: %s", ex)
-    except requests.exceptions.JSONDecodeError as ex:
+    except ValueError as ex:
         LOGGER.error("Korp Corpus Info Error: %s", ex)
     return None
 
 
-def get_modern_corpora(api_base_url: str = API_BASE_URL) -> List[str]:
-    info = get_korp_info(api_base_url=api_base_url)
+def get_modern_corpora(
+    api_base_url: ApiBaseUrl = API_BASE_URL,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
+) -> List[str]:
+    info = get_korp_info(api_base_url=api_base_url, timeout=timeout)
 
     protected_corpora = set(info["protected_corpora"])
     open_corpora = info["corpora"]
@@ -198,7 +448,12 @@ def make_query(
     corpora_names: Union[str, List[str], Set[str]],
     start_record: int = 0,
     maximum_records: int = 250,
-    api_base_url: str = API_BASE_URL,
+    api_base_url: ApiBaseUrl = API_BASE_URL,
+    query_data: Optional[str] = None,
+    show: Sequence[str] = SHOW_ADVANCED,
+    context: str = CONTEXT_SENTENCE,
+    within: Optional[str] = None,
+    timeout: Optional[float] = DEFAULT_TIMEOUT,
 ) -> Optional[Dict[str, Any]]:
     if not corpora_names:
         return None
@@ -212,18 +467,31 @@ def make_query(
     )
     cqp_query = quote_plus(cqp_query, encoding="utf-8")
 
-    query_string = "command=query&defaultcontext=1+sentence&show=msd,lemma&cqp="
+    context = quote_plus(context)
+    show_param = f"&show={','.join(show)}" if show else ""
+    within_param = f"&defaultwithin={quote_plus(within)}" if within else ""
+    query_string = (
+        f"command=query&defaultcontext={context}{within_param}{show_param}&cqp="
+    )
     range_param = f"&start={start_record}&end={maximum_records}"
     corpus_param = "&corpus="
 
-    url = f"{api_base_url}?{query_string}{cqp_query}{range_param}{corpus_param}{corpora_names}"
+    url = f"{query_string}{cqp_query}{range_param}{corpus_param}{corpora_names}"
+
+    import requests
+
     try:
-        resp = requests.get(url)
+        # cursor from a previous query (can be large), Korp then
+        # does not need to re-count hits for each corpus
+        data = {"querydata": query_data} if query_data else None
+        resp = _request(
+            api_base_url, url, data=data, affinity=corpora_names, timeout=timeout
+        )
         resp.raise_for_status()
-        return resp.json()
-    except requests.exceptions.HTTPError as ex:
+        return _decode_json(resp)
+    except requests.exceptions.RequestException as ex:
         LOGGER.error("Korp Corpus Info Error: %s", ex)
-    except requests.exceptions.JSONDecodeError as ex:
+    except ValueError as ex:
         LOGGER.error("Korp Corpus Info Error: %s", ex)
     return None
 
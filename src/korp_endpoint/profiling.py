@@ -0,0 +1,296 @@
+"""
+On-demand per-request CPU sampling and allocation tracing.
+
+Profiles are written as "folded stacks" (one ``frame;frame;frame count``
+line per stack), which can be rendered with ``flamegraph.pl``, speedscope
+or similar tools.
+"""
+
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Dict
+from typing import Iterator
+from typing import List
+from typing import Optional
+
+# ---------------------------------------------------------------------------
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    name = (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+    return name.replace(";", ":")
+
+
+class SamplingProfiler:
+    """Samples the call stack of a single thread from a background thread,
+    optionally also traces memory allocations (`tracemalloc`)."""
+
+    def __init__(
+        self,
+        thread_id: int,
+        interval: float = 0.005,
+        max_duration: float = 30.0,
+        trace_memory: bool = False,
+    ) -> None:
+        """[Constructor]
+
+        Args:
+            thread_id: identifier of the thread to sample
+            interval: sampling interval in seconds
+            max_duration: stop sampling (and tracing) after this many seconds
+            trace_memory: whether to trace memory allocations, too
+        """
+        self.thread_id = thread_id
+        self.interval = interval
+        self.max_duration = max_duration
+        self.trace_memory = trace_memory
+        self.stacks: Dict[str, int] = {}
+        self.snapshot: Optional[tracemalloc.Snapshot] = None
+        """Allocations still alive when tracing stopped"""
+        self.peak = 0
+        """Peak traced memory in bytes"""
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        if self.trace_memory:
+            tracemalloc.start(25)
+        self._thread = threading.Thread(
+            target=self._run, name="korp-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> Dict[str, int]:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._stop_tracing()
+        return self.stacks
+
+    def _stop_tracing(self) -> None:
+        if self.trace_memory and tracemalloc.is_tracing():
+            self.snapshot = tracemalloc.take_snapshot()
+            self.peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    def _run(self) -> None:
+        deadline = time.monotonic() + self.max_duration
+        while not self._stop.wait(self.interval):
+            if time.monotonic() > deadline:
+                LOGGER.warning("Profiling stopped after %ss", self.max_duration)
+                # tracing slows down every allocation of the whole process
+                self._stop_tracing()
+                break
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                break
+            names: List[str] = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            stack = ";".join(reversed(names))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+
+def write_folded(filename: str, stacks: Dict[str, int]) -> None:
+    with open(filename, "w", encoding="utf-8") as fp:
+        for stack, count in sorted(stacks.items()):
+            fp.write(f"{stack} {count}\n")
+
+
+def snapshot_to_folded(snapshot: tracemalloc.Snapshot) -> Dict[str, int]:
+    """Convert allocations (still alive at snapshot time) to folded stacks,
+    weighted by allocated bytes."""
+    stacks: Dict[str, int] = {}
+    for stat in snapshot.statistics("traceback"):
+        # tracemalloc frames are most recent first
+        names = [
+            f"{os.path.basename(frame.filename)}:{frame.lineno}".replace(";", ":")
+            for frame in reversed(stat.traceback)
+        ]
+        stack = ";".join(names)
+        stacks[stack] = stacks.get(stack, 0) + stat.size
+    return stacks
+
+
+# ---------------------------------------------------------------------------
+
+
+class RequestProfiler:
+    """Decides which requests are profiled and writes the results.
+
+    Requests are profiled if they carry the admin token (CPU and
+    allocations) or are randomly sampled (CPU only). At most
+    ``max_concurrent`` requests are profiled at the same time, others are
+    run without profiling. Allocations are only traced if no other request
+    is running (see `track`), as `tracemalloc` traces the whole process.
+    """
+
+    def __init__(
+        self,
+        output_dir: str,
+        token: Optional[str] = None,
+        sample_rate: float = 0.0,
+        interval: float = 0.005,
+        max_duration: float = 30.0,
+        max_concurrent: int = 1,
+    ) -> None:
+        """[Constructor]
+
+        Args:
+            output_dir: directory to write profiles to
+            token: secret to request profiling with the ``X-Korp-Profile``
+                header, ``None`` to disable
+            sample_rate: fraction (``0.0`` - ``1.0``) of requests to
+                randomly profile
+            interval: CPU sampling interval in seconds (at least 1ms)
+            max_duration: maximum profiling time per request in seconds
+            max_concurrent: maximum number of concurrently profiled requests
+        """
+        self.output_dir = output_dir
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = max(0.001, interval)
+        self.max_duration = max_duration
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrent))
+        self._counter = 0
+        self._counter_lock = threading.Lock()
+        self._active = 0
+        """Number of running requests"""
+        self._started = 0
+        """Number of started requests"""
+
+    def check(self, value: Optional[str]) -> Optional[bool]:
+        """Check whether a request should be profiled.
+
+        Args:
+            value: the value of the ``X-Korp-Profile`` request header
+
+        Returns:
+            Optional[bool]: ``None`` to not profile, else whether to trace
+                memory allocations, too
+        """
+        if value and self.token and hmac.compare_digest(value, self.token):
+            return True
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            return False
+        return None
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        """Track a running request, profiled or not."""
+        with self._counter_lock:
+            self._active += 1
+            self._started += 1
+        try:
+            yield
+        finally:
+            with self._counter_lock:
+                self._active -= 1
+
+    @contextmanager
+    def profile(self, name: str, trace_memory: bool = False) -> Iterator[None]:
+        if not self._slots.acquire(blocking=False):
+            LOGGER.debug("Skip profiling of '%s', too many active profiles", name)
+            yield
+            return
+
+        try:
+            with self._counter_lock:
+                self._counter += 1
+                prefix = os.path.join(
+                    self.output_dir,
+                    f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._counter}",
+                )
+                # the profiled request itself is tracked, too
+                others = max(0, self._active - 1)
+                started = self._started
+
+            memory_note: Optional[str] = None
+            if trace_memory and others:
+                # tracemalloc traces all threads, allocations of concurrent
+                # requests (gthread workers) would end up in this profile
+                LOGGER.info(
+                    "Skip memory tracing of '%s', %s other requests are running",
+                    name,
+                    others,
+                )
+                memory_note = f"skipped, {others} other requests were running"
+                trace_memory = False
+
+            profiler = SamplingProfiler(
+                threading.get_ident(), self.interval, self.max_duration, trace_memory
+            )
+            profiler.start()
+            start = time.perf_counter()
+            try:
+                yield
+            finally:
+                duration = time.perf_counter() - start
+                stacks = profiler.stop()
+                if trace_memory:
+                    with self._counter_lock:
+                        concurrent = self._started - started
+                    if concurrent:
+                        memory_note = (
+                            f"includes allocations of {concurrent} requests"
+                            " started while tracing"
+                        )
+                self._write(
+                    prefix,
+                    name,
+                    duration,
+                    stacks,
+                    profiler.snapshot,
+                    profiler.peak,
+                    memory_note,
+                )
+        finally:
+            self._slots.release()
+
+    def _write(
+        self,
+        prefix: str,
+        name: str,
+        duration: float,
+        stacks: Dict[str, int],
+        snapshot: Optional[tracemalloc.Snapshot],
+        peak: int,
+        memory_note: Optional[str] = None,
+    ) -> None:
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(f"{prefix}.txt", "w", encoding="utf-8") as fp:
+                fp.write(f"request: {name}\n")
+                fp.write(f"duration: {duration:.6f}s\n")
+                fp.write(f"samples: {sum(stacks.values())}\n")
+                fp.write(f"interval: {self.interval}s\n")
+                if snapshot is not None:
+                    fp.write(f"peak traced memory: {peak} bytes\n")
+                if memory_note is not None:
+                    fp.write(f"memory tracing: {memory_note}\n")
+            write_folded(f"{prefix}.cpu.folded", stacks)
+            if snapshot is not None:
+                write_folded(f"{prefix}.alloc.folded", snapshot_to_folded(snapshot))
+            LOGGER.info("Wrote profile for '%s' to %s.*", name, prefix)
+        except OSError as ex:
+            LOGGER.warning("Could not write profile: %s", ex)
+
+
+# ---------------------------------------------------------------------------
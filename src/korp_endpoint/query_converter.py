@@ -2,8 +2,10 @@
 A Korp CLARIN FCS 2.0 endpoint example converter of FCS to CQP.
 """
 
+import itertools
 import logging
 from typing import List
+from typing import Optional
 from typing import Union
 
 import cql
@@ -23,9 +25,25 @@ LOGGER = logging.getLogger(__name__)
 # ---------------------------------------------------------------------------
 
 
+MAX_CQL_AND_OPERANDS = 4
+"""Maximum number of ``AND`` operands (the CQP query lists all orders)"""
+
+CQL_BOOLEAN_WITHIN = "sentence"
+"""Structure that matches of Boolean CQL queries must lie within"""
+
+
 def cql2cqp(query: CQLQuery) -> str:
     """Convert CQL query to CQP query string.
 
+    Boolean queries are compiled into a single CQP query:
+
+    * ``a OR b`` matches either operand,
+    * ``a AND b`` matches both operands in any order (the match spans
+      from the first to the last operand), they should be searched
+      within a sentence, see `get_cql_within`,
+    * ``a NOT b`` matches whole sentences containing ``a`` but not ``b``,
+      where ``b`` must be a single word or an ``OR`` of single words.
+
     Args:
         query: the CQL query
 
@@ -36,37 +54,148 @@ def cql2cqp(query: CQLQuery) -> str:
         SRUException: If the query is too complex or it cannot be performed for any other reason
     """
 
-    node: Union[
-        cql.parser.CQLTriple, cql.parser.CQLSearchClause
-    ] = query.parsed_query.root
+    node: Union[cql.parser.CQLTriple, cql.parser.CQLSearchClause] = (
+        query.parsed_query.root
+    )
 
-    # Translate the CQL query to a Lucene query.
+    # Translate the CQL query to a CQP query.
     # If a CQL feature was used, that is not supported by us,
     # throw a SRU error (with a detailed error message)
-    # Right now, we're pretty stupid and only support terms
 
-    if isinstance(node, cql.parser.CQLTriple):
-        operator = node.operator.value
+    if isinstance(node, cql.parser.CQLTriple) and _get_cql_operator(node) == "not":
+        # NOT is only supported on the top level (chained to the left)
+        excluded: List[str] = []
+        while (
+            isinstance(node, cql.parser.CQLTriple) and _get_cql_operator(node) == "not"
+        ):
+            excluded.insert(0, _transform_cql_exclusion(node.right))
+            node = node.left
+        exclude = " | ".join(excluded)
+        gap = f"[!({exclude})]*"
+        positive = _transform_cql_node(node, exclude)
+        return f"<{CQL_BOOLEAN_WITHIN}> {gap} {positive} {gap} </{CQL_BOOLEAN_WITHIN}>"
+
+    return _transform_cql_node(node)
+
+
+def get_cql_within(query: CQLQuery) -> Optional[str]:
+    """Get the structure that CQP matches of a CQL query must lie within.
+
+    Args:
+        query: the CQL query
+
+    Returns:
+        Optional[str]: the Korp structural attribute (``defaultwithin``),
+            ``None`` for plain terms
+    """
+    if isinstance(query.parsed_query.root, cql.parser.CQLTriple):
+        return CQL_BOOLEAN_WITHIN
+    return None
+
+
+def _get_cql_operator(node: cql.parser.CQLTriple) -> str:
+    operator = node.operator.value.lower()
+    if operator not in ("and", "or", "not") or node.operator.modifiers:
         raise SRUException(
             SRUDiagnostics.UNSUPPORTED_BOOLEAN_OPERATOR,
             operator,
-            message=f"Unsupported Boolean operator: {operator}",
+            message=f"Unsupported Boolean operator: {node.operator.toCQL()}",
         )
+    return operator
 
+
+def _transform_cql_node(
+    node: Union[cql.parser.CQLTriple, cql.parser.CQLSearchClause],
+    exclude: Optional[str] = None,
+) -> str:
     if isinstance(node, cql.parser.CQLSearchClause):
-        terms = node.term.lower().split()  # .casefold()?
-        if len(terms) == 1:
-            return f"[word = '{terms[0]}']"
+        return "".join(
+            f"[{_add_cql_exclusion(cond, exclude)}]"
+            for cond in _transform_cql_terms(node)
+        )
 
-        # from java implementation, not sure whether this is the best escaping strategy ...
-        terms = [term.strip("\"'") for term in terms]
-        return "".join(f"[word = '{term}']" for term in terms)
+    if isinstance(node, cql.parser.CQLTriple):
+        operator = _get_cql_operator(node)
+        if operator == "or":
+            left = _transform_cql_node(node.left, exclude)
+            right = _transform_cql_node(node.right, exclude)
+            return f"({left} | {right})"
+        if operator == "and":
+            operands = _flatten_cql_operands(node, operator)
+            parts = [_transform_cql_node(operand, exclude) for operand in operands]
+            parts = list(dict.fromkeys(parts))
+            if len(parts) > MAX_CQL_AND_OPERANDS:
+                raise SRUException(
+                    FCSDiagnostics.GENERAL_QUERY_TOO_COMPLEX_CANNOT_PERFORM_QUERY,
+                    message=(
+                        "Endpoint supports at most "
+                        f"{MAX_CQL_AND_OPERANDS} AND operands"
+                    ),
+                )
+            # unordered: list all orders with arbitrary tokens in between
+            gap = f" [{_add_cql_exclusion('', exclude)}]* "
+            if len(parts) == 1:
+                return parts[0]
+            alternatives = [gap.join(order) for order in itertools.permutations(parts)]
+            return f"({' | '.join(alternatives)})"
+        raise SRUException(
+            SRUDiagnostics.UNSUPPORTED_BOOLEAN_OPERATOR,
+            operator,
+            message="Endpoint only supports NOT on the top level of a query",
+        )
 
     raise SRUException(
         SRUDiagnostics.CANNOT_PROCESS_QUERY_REASON_UNKNOWN, f"unknown cql node: {node}"
     )
 
 
+def _transform_cql_terms(node: cql.parser.CQLSearchClause) -> List[str]:
+    terms = node.term.lower().split()  # .casefold()?
+    if len(terms) == 1:
+        return [f"word = '{terms[0]}'"]
+
+    # from java implementation, not sure whether this is the best escaping strategy ...
+    terms = [term.strip("\"'") for term in terms]
+    return [f"word = '{term}'" for term in terms]
+
+
+def _transform_cql_exclusion(
+    node: Union[cql.parser.CQLTriple, cql.parser.CQLSearchClause],
+) -> str:
+    # a token condition, CQP cannot exclude sequences within a structure
+    if isinstance(node, cql.parser.CQLSearchClause):
+        conds = _transform_cql_terms(node)
+        if len(conds) == 1:
+            return conds[0]
+    elif _get_cql_operator(node) == "or":
+        left = _transform_cql_exclusion(node.left)
+        right = _transform_cql_exclusion(node.right)
+        return f"{left} | {right}"
+    raise SRUException(
+        SRUDiagnostics.UNSUPPORTED_BOOLEAN_OPERATOR,
+        "not",
+        message="Endpoint only supports NOT with single words",
+    )
+
+
+def _add_cql_exclusion(cond: str, exclude: Optional[str]) -> str:
+    if not exclude:
+        return cond
+    if not cond:
+        return f"!({exclude})"
+    return f"{cond} & !({exclude})"
+
+
+def _flatten_cql_operands(
+    node: Union[cql.parser.CQLTriple, cql.parser.CQLSearchClause], operator: str
+) -> List[Union[cql.parser.CQLTriple, cql.parser.CQLSearchClause]]:
+    if isinstance(node, cql.parser.CQLTriple) and _get_cql_operator(node) == operator:
+        return _flatten_cql_operands(node.left, operator) + _flatten_cql_operands(
+            node.right, operator
+        )
+    return [node]
+
+
 # ---------------------------------------------------------------------------
 
 
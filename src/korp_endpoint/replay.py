@@ -0,0 +1,414 @@
+"""
+Access log replay and startup warm-up.
+
+Parses gunicorn access logs (default format, ``--access-logfile``) for
+``searchRetrieve`` requests and either replays them against a running
+endpoint (load generator) or runs the most frequent queries in-process,
+e.g. when a worker starts, so that result sets, corpus statistics and
+Korp-side caches are warm before real traffic arrives.
+
+Usage::
+
+    python -m korp_endpoint.replay top /logs/access.log -n 20
+    python -m korp_endpoint.replay replay /logs/access.log \\
+        --url http://localhost:5000/ --rate 20 --concurrency 8
+    python -m korp_endpoint.replay warmup /logs/access.log -n 20
+"""
+
+import argparse
+import logging
+import os
+import re
+import threading
+import time
+import typing
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict
+from typing import Iterable
+from typing import Iterator
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+from urllib.parse import parse_qsl
+from urllib.parse import urlencode
+from urllib.parse import urlsplit
+
+if typing.TYPE_CHECKING:
+    from korp_endpoint.wsgi import KorpSRUServerApp
+
+# ---------------------------------------------------------------------------
+
+
+LOGGER = logging.getLogger(__name__)
+
+# gunicorn default: '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s"'
+ACCESS_LOG_PATTERN = re.compile(
+    r'\[(?P<time>[^\]]+)\] "(?P<method>[A-Z]+) (?P<target>\S+) [^"]*" (?P<status>\d{3}) '
+)
+ACCESS_LOG_TIME_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+
+QueryKey = Tuple[str, str]
+"""Query type and query string"""
+
+
+@dataclass(frozen=True)
+class LogEntry:
+    time: Optional[float]
+    """Request time as UNIX timestamp, if it could be parsed"""
+    method: str
+    target: str
+    """Request path and query string"""
+    status: int
+
+
+# ---------------------------------------------------------------------------
+
+
+def parse_access_log(lines: Iterable[str]) -> Iterator[LogEntry]:
+    """Parse ``searchRetrieve`` requests from access log lines. Lines in
+    other formats and other requests are skipped."""
+    from datetime import datetime
+
+    for line in lines:
+        match = ACCESS_LOG_PATTERN.search(line)
+        if match is None:
+            continue
+        target = match.group("target")
+        if "searchRetrieve" not in target:
+            continue
+        try:
+            timestamp: Optional[float] = datetime.strptime(
+                match.group("time"), ACCESS_LOG_TIME_FORMAT
+            ).timestamp()
+        except ValueError:
+            timestamp = None
+        yield LogEntry(
+            time=timestamp,
+            method=match.group("method"),
+            target=target,
+            status=int(match.group("status")),
+        )
+
+
+def read_access_log(
+    filename: str, max_bytes: Optional[int] = None
+) -> Iterator[LogEntry]:
+    """Read a log file, optionally only the last ``max_bytes`` bytes."""
+    with open(filename, "r", encoding="utf-8", errors="replace") as fp:
+        if max_bytes:
+            size = fp.seek(0, os.SEEK_END)
+            if size > max_bytes:
+                fp.seek(size - max_bytes)
+                fp.readline()  # skip partial line
+            else:
+                fp.seek(0)
+        yield from parse_access_log(fp)
+
+
+def get_query_key(target: str) -> Optional[QueryKey]:
+    params = dict(parse_qsl(urlsplit(target).query))
+    if params.get("operation") != "searchRetrieve" or not params.get("query"):
+        return None
+    return params.get("queryType", "cql"), params["query"]
+
+
+def top_queries(entries: Iterable[LogEntry], n: int) -> List[Tuple[QueryKey, int]]:
+    """Count successful queries, most frequent first.
+
+    Args:
+        entries: parsed access log entries
+        n: number of queries to return
+
+    Returns:
+        List[Tuple[QueryKey, int]]: query type and query with its count
+    """
+    counts: Counter = Counter()
+    for entry in entries:
+        if entry.method != "GET" or entry.status != 200:
+            continue
+        key = get_query_key(entry.target)
+        if key is not None:
+            counts[key] += 1
+    return counts.most_common(n)
+
+
+def make_target(key: QueryKey, path: str = "/") -> str:
+    query_type, query = key
+    params = {"operation": "searchRetrieve", "query": query}
+    if query_type != "cql":
+        params["queryType"] = query_type
+    return f"{path}?{urlencode(params)}"
+
+
+# ---------------------------------------------------------------------------
+
+
+def warm_up(
+    app: "KorpSRUServerApp",
+    keys: Sequence[QueryKey],
+    max_time: float = 60.0,
+) -> int:
+    """Run queries in-process through the app: query translation
+    (`cql2cqp`/`fcs2cqp`), the Korp client and the result set cache.
+
+    Args:
+        app: the WSGI app
+        keys: queries to run
+        max_time: stop after this many seconds
+
+    Returns:
+        int: number of queries run
+    """
+    from werkzeug.test import Client
+
+    client = Client(app)
+    deadline = time.monotonic() + max_time
+    done = 0
+    for key in keys:
+        if time.monotonic() > deadline:
+            LOGGER.warning("Warm-up stopped after %ss", max_time)
+            break
+        try:
+            resp = client.get(make_target(key))
+            if resp.status_code != 200:
+                LOGGER.debug("Warm-up query %s failed: %s", key, resp.status)
+        except Exception:
+            LOGGER.exception("Warm-up query %s failed", key)
+        done += 1
+
+    # background threads (result set fills) must not be running when
+    # gunicorn forks workers from a preloaded app
+    wait = getattr(app.search_engine, "wait_for_background_tasks", None)
+    if wait is not None:
+        wait()
+    return done
+
+
+def warm_up_from_log(
+    app: "KorpSRUServerApp",
+    filename: str,
+    top_n: int = 20,
+    max_time: float = 60.0,
+    max_bytes: int = 64 * 1024 * 1024,
+) -> int:
+    """Warm up with the ``top_n`` most frequent queries of an access log.
+    Errors are logged, so a missing log file does not prevent startup."""
+    start = time.perf_counter()
+    try:
+        entries = read_access_log(filename, max_bytes)
+        keys = [key for key, _ in top_queries(entries, top_n)]
+    except OSError as ex:
+        LOGGER.warning("Cannot read access log for warm-up: %s", ex)
+        return 0
+    done = warm_up(app, keys, max_time=max_time)
+    LOGGER.info(
+        "Warm-up with %s queries from '%s' took %.2fs",
+        done,
+        filename,
+        time.perf_counter() - start,
+    )
+    return done
+
+
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class ReplayResult:
+    latencies: List[float]
+    """Response times in seconds (from the scheduled start, if rate limited)"""
+    statuses: Counter
+    errors: int
+    duration: float
+
+
+def replay(
+    base_url: str,
+    targets: Sequence[str],
+    rate: float = 0.0,
+    concurrency: int = 4,
+    timeout: float = 60.0,
+) -> ReplayResult:
+    """Replay request targets against a running endpoint.
+
+    With a ``rate``, requests are started on a fixed schedule (open loop),
+    and latencies are measured from the scheduled start, so that queueing
+    because of a slow endpoint is included. Without a rate, ``concurrency``
+    clients send requests back to back.
+
+    Args:
+        base_url: endpoint URL, e.g. ``http://localhost:5000``
+        targets: request paths with query string (from the access log)
+        rate: requests per second, ``0`` for as fast as possible
+        concurrency: number of parallel connections
+        timeout: request timeout in seconds
+
+    Returns:
+        ReplayResult: latencies and status counts
+    """
+    import requests
+
+    base_url = base_url.rstrip("/")
+    local = threading.local()
+    lock = threading.Lock()
+    result = ReplayResult(latencies=[], statuses=Counter(), errors=0, duration=0.0)
+
+    def _send(target: str, scheduled: float) -> None:
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        status: Optional[int] = None
+        try:
+            resp = session.get(f"{base_url}{target}", timeout=timeout)
+            status = resp.status_code
+        except requests.exceptions.RequestException as ex:
+            LOGGER.debug("Request failed: %s", ex)
+        latency = time.perf_counter() - scheduled
+        with lock:
+            if status is None:
+                result.errors += 1
+            else:
+                result.statuses[status] += 1
+                result.latencies.append(latency)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max(1, concurrency), "korp-replay") as executor:
+        if rate > 0:
+            for i, target in enumerate(targets):
+                scheduled = start + i / rate
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(_send, target, scheduled)
+        else:
+            for target in targets:
+                executor.submit(lambda t: _send(t, time.perf_counter()), target)
+    result.duration = time.perf_counter() - start
+    return result
+
+
+def format_report(result: ReplayResult) -> str:
+    lines = []
+    total = len(result.latencies) + result.errors
+    lines.append(
+        f"requests: {total} in {result.duration:.1f}s"
+        f" ({total / result.duration if result.duration else 0:.1f}/s),"
+        f" errors: {result.errors}"
+    )
+    lines.append(
+        "status: "
+        + ", ".join(f"{code}={n}" for code, n in sorted(result.statuses.items()))
+    )
+    latencies = sorted(result.latencies)
+    if latencies:
+        lines.append(
+            "latency: "
+            + "  ".join(
+                f"{label}={percentile(latencies, p) * 1000:.1f}ms"
+                for label, p in (
+                    ("min", 0),
+                    ("p50", 50),
+                    ("p90", 90),
+                    ("p95", 95),
+                    ("p99", 99),
+                    ("max", 100),
+                )
+            )
+        )
+        lines.extend(format_histogram(latencies))
+    return "\n".join(lines)
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    index = min(len(values) - 1, max(0, int(round(p / 100 * len(values))) - 1))
+    return values[index]
+
+
+def format_histogram(latencies: Sequence[float], width: int = 40) -> List[str]:
+    bounds = [0.005 * 2**i for i in range(14)]  # 5ms - 41s
+    counts: Dict[float, int] = Counter()
+    for latency in latencies:
+        bound = next((b for b in bounds if latency <= b), bounds[-1])
+        counts[bound] += 1
+    largest = max(counts.values())
+    return [
+        f"  <= {bound * 1000:8.0f}ms {counts[bound]:6d} "
+        + "#" * max(1, round(counts[bound] / largest * width))
+        for bound in bounds
+        if counts.get(bound)
+    ]
+
+
+# ---------------------------------------------------------------------------
+
+
+def main(argv: Optional[Sequence[str]] = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="python -m korp_endpoint.replay", description=__doc__.split("\n\n")[0]
+    )
+    parser.add_argument("-v", "--verbose", action="store_true")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cmd_top = commands.add_parser("top", help="list most frequent queries")
+    cmd_top.add_argument("logfile")
+    cmd_top.add_argument("-n", "--top", type=int, default=20)
+
+    cmd_replay = commands.add_parser("replay", help="replay against an endpoint")
+    cmd_replay.add_argument("logfile")
+    cmd_replay.add_argument("--url", default="http://localhost:5000")
+    cmd_replay.add_argument(
+        "--rate", type=float, default=0.0, help="requests/s, 0 = max"
+    )
+    cmd_replay.add_argument("--concurrency", type=int, default=4)
+    cmd_replay.add_argument("--limit", type=int, default=0, help="max requests")
+    cmd_replay.add_argument("--timeout", type=float, default=60.0)
+
+    cmd_warmup = commands.add_parser("warmup", help="run top queries in-process")
+    cmd_warmup.add_argument("logfile")
+    cmd_warmup.add_argument("-n", "--top", type=int, default=20)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format="[%(levelname).1s][%(name)s:%(lineno)s] %(message)s",
+    )
+
+    if args.command == "top":
+        for (query_type, query), count in top_queries(
+            read_access_log(args.logfile), args.top
+        ):
+            print(f"{count:8d}  {query_type:<4} {query}")
+
+    elif args.command == "replay":
+        targets = [
+            entry.target
+            for entry in read_access_log(args.logfile)
+            if entry.method == "GET"
+        ]
+        if args.limit:
+            targets = targets[: args.limit]
+        LOGGER.info("Replaying %s requests against %s", len(targets), args.url)
+        result = replay(
+            args.url,
+            targets,
+            rate=args.rate,
+            concurrency=args.concurrency,
+            timeout=args.timeout,
+        )
+        print(format_report(result))
+
+    elif args.command == "warmup":
+        from korp_endpoint.app import make_app
+
+        warm_up_from_log(make_app(), args.logfile, top_n=args.top)
+
+
+if __name__ == "__main__":
+    main()
+
+
+# ---------------------------------------------------------------------------
@@ -0,0 +1,309 @@
+"""
+Server-side result sets for deep paging.
+
+A result set remembers a translated query, the queried corpora, the Korp
+``querydata`` cursor and already fetched kwic windows, so later pages
+(``startRecord``) can be served without re-running the whole query.
+Result sets that were started with an adaptive corpus order (see
+`korp_endpoint.adaptive`) also remember that order, so all their pages
+follow it.
+
+Result sets are kept in memory per process. Their public handles
+(``resultSetId``) also carry the original query, so that a worker that
+does not know a result set (created by another worker or expired) can
+rebuild it.
+"""
+
+import base64
+import binascii
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+from typing import Tuple
+
+from clarin.sru.constants import SRUResultCountPrecision
+
+# ---------------------------------------------------------------------------
+
+
+LOGGER = logging.getLogger(__name__)
+
+
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class ResultSet:
+    """A server-side result set handle."""
+
+    id: str
+    """The result set identifier (``resultSetId``)"""
+    query: str
+    """The CQP query"""
+    corpora: Tuple[str, ...]
+    """The queried Korp corpora"""
+    show: Tuple[str, ...]
+    """The requested Korp positional attributes"""
+    ttl: int
+    """Time to live in seconds, renewed on each access"""
+    within: Optional[str] = None
+    """The structure that matches must lie within (Korp ``defaultwithin``)"""
+    hits: int = -1
+    """Total number of hits, ``-1`` if not (yet) known"""
+    precision: SRUResultCountPrecision = SRUResultCountPrecision.EXACT
+    """Precision of `hits`, may change while counts are being filled in"""
+    query_data: Optional[str] = None
+    """The Korp-side cursor (``querydata``) to speed up follow-up queries"""
+    windows: Dict[int, List[Dict[str, Any]]] = field(default_factory=dict)
+    """Fetched kwic windows, by (0-based) start offset"""
+    source: Optional[Tuple[str, str]] = None
+    """The query type and query the result set was created from, see
+    `handle`"""
+    segments: Optional[List[Tuple[Tuple[str, ...], int]]] = None
+    """Adaptive corpus order: corpus batches with their hits (``-1`` if not
+    yet known), records are ordered batch by batch; ``None`` for a single
+    query on all `corpora`"""
+    expires: float = 0.0
+    lock: threading.RLock = field(default_factory=threading.RLock, repr=False)
+
+    @property
+    def is_expired(self) -> bool:
+        return time.monotonic() > self.expires
+
+    @property
+    def handle(self) -> str:
+        """The public identifier (``resultSetId``), with the `source` query
+        encoded if known."""
+        if self.source is None:
+            return self.id
+        raw = ":".join(self.source).encode("utf-8")
+        payload = base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+        return f"{self.id}.{payload}"
+
+    @property
+    def is_new(self) -> bool:
+        """Whether nothing was queried for this result set yet."""
+        return self.hits < 0 and self.segments is None and not self.windows
+
+    @property
+    def kwic_count(self) -> int:
+        return sum(len(kwic) for kwic in self.windows.values())
+
+    def touch(self) -> None:
+        self.expires = time.monotonic() + self.ttl
+
+    def get_kwic(self, start: int, count: int) -> Optional[List[Dict[str, Any]]]:
+        """Get kwic lines from already fetched windows.
+
+        Args:
+            start: 0-based offset of the first hit
+            count: number of hits
+
+        Returns:
+            List[Dict[str, Any]]: the kwic lines or ``None`` if the range
+                is not (completely) available
+        """
+        if self.hits < 0:
+            return None
+        end = start + count
+        if self.precision == SRUResultCountPrecision.EXACT:
+            end = min(end, self.hits)
+        with self.lock:
+            for wstart, kwic in self.windows.items():
+                if wstart <= start and wstart + len(kwic) >= end:
+                    return kwic[start - wstart : end - wstart]
+        return None
+
+    def update(self, result: Dict[str, Any], start: int) -> None:
+        """Update with a Korp query result.
+
+        Args:
+            result: the Korp ``command=query`` result (on all corpora)
+            start: 0-based offset of the first hit in the result
+        """
+        with self.lock:
+            if "hits" in result:
+                self.hits = result["hits"]
+                self.precision = SRUResultCountPrecision.EXACT
+            query_data = result.get("querydata") or result.get("query_data")
+            if query_data:
+                self.query_data = query_data
+            if result.get("kwic"):
+                self.windows[start] = result["kwic"]
+
+    def set_segment_hits(self, index: int, hits: int) -> None:
+        """Set the number of hits of a segment (adaptive corpus order), the
+        total becomes exact once all segments are known.
+
+        Args:
+            index: index of the segment
+            hits: number of hits in the segment
+        """
+        with self.lock:
+            assert self.segments is not None
+            corpora, _ = self.segments[index]
+            self.segments[index] = (corpora, hits)
+            if all(hits >= 0 for _, hits in self.segments):
+                self.hits = sum(hits for _, hits in self.segments)
+                self.precision = SRUResultCountPrecision.EXACT
+
+
+# ---------------------------------------------------------------------------
+
+
+class ResultSetCache:
+    """A thread-safe, size-bounded store of `ResultSet` handles.
+
+    Result set identifiers are derived from query and corpora, so repeated
+    identical queries (e.g. clients paging without passing the
+    ``resultSetId``) will resume the same result set.
+    """
+
+    def __init__(
+        self,
+        ttl: int = 300,
+        max_entries: int = 256,
+        max_kwic: int = 5000,
+        max_total_kwic: int = 10000,
+    ) -> None:
+        """[Constructor]
+
+        Args:
+            ttl: default time to live in seconds
+            max_entries: maximum number of result sets, oldest ones are
+                evicted first
+            max_kwic: maximum number of kwic lines kept per result set,
+                older windows are dropped first
+            max_total_kwic: maximum number of kwic lines kept in all result
+                sets together, windows of the least recently used result
+                sets are dropped first
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_kwic = max_kwic
+        self.max_total_kwic = max_total_kwic
+        self._entries: Dict[str, ResultSet] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_id(
+        query: str,
+        corpora: Sequence[str],
+        show: Sequence[str] = (),
+        within: Optional[str] = None,
+    ) -> str:
+        key = "\0".join([query, *sorted(corpora), "", *show])
+        if within:
+            key = f"{key}\0\0{within}"
+        return hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+
+    @staticmethod
+    def parse_handle(handle: str) -> Tuple[str, Optional[Tuple[str, str]]]:
+        """Split a result set handle (see `ResultSet.handle`).
+
+        Args:
+            handle: the public result set identifier
+
+        Returns:
+            Tuple[str, Optional[Tuple[str, str]]]: the result set identifier
+                and the query type and query, if encoded (and valid)
+        """
+        id, _, payload = handle.partition(".")
+        if not payload:
+            return id, None
+        try:
+            padded = payload + "=" * (-len(payload) % 4)
+            raw = base64.urlsafe_b64decode(padded.encode("ascii")).decode("utf-8")
+        except (binascii.Error, UnicodeError, ValueError):
+            return id, None
+        query_type, sep, query = raw.partition(":")
+        if not sep:
+            return id, None
+        return id, (query_type, query)
+
+    def get(self, id: str) -> Optional[ResultSet]:
+        with self._lock:
+            rs = self._entries.get(id)
+            if rs is None:
+                return None
+            if rs.is_expired:
+                del self._entries[id]
+                return None
+            rs.touch()
+            return rs
+
+    def get_or_create(
+        self,
+        query: str,
+        corpora: Sequence[str],
+        ttl: Optional[int] = None,
+        show: Sequence[str] = (),
+        within: Optional[str] = None,
+        source: Optional[Tuple[str, str]] = None,
+    ) -> ResultSet:
+        id = self.make_id(query, corpora, show, within)
+        rs = self.get(id)
+        if rs is not None:
+            return rs
+
+        rs = ResultSet(
+            id=id,
+            query=query,
+            corpora=tuple(corpora),
+            show=tuple(show),
+            ttl=ttl or self.ttl,
+            within=within,
+            source=source,
+        )
+        rs.touch()
+        with self._lock:
+            self._purge()
+            rs = self._entries.setdefault(id, rs)
+        return rs
+
+    def trim(self, rs: ResultSet) -> None:
+        """Drop the oldest fetched windows if the result set holds too many
+        kwic lines, then windows of the least recently used result sets if
+        all result sets together hold too many."""
+        with rs.lock:
+            while len(rs.windows) > 1 and rs.kwic_count > self.max_kwic:
+                del rs.windows[next(iter(rs.windows))]
+
+        with self._lock:
+            total = 0
+            for entry in self._entries.values():
+                with entry.lock:
+                    total += entry.kwic_count
+            if total <= self.max_total_kwic:
+                return
+            for entry in sorted(self._entries.values(), key=lambda rs: rs.expires):
+                with entry.lock:
+                    # keep the window that was just fetched
+                    keep = 1 if entry is rs else 0
+                    while len(entry.windows) > keep and total > self.max_total_kwic:
+                        total -= len(entry.windows.pop(next(iter(entry.windows))))
+                if total <= self.max_total_kwic:
+                    break
+            LOGGER.debug("Trimmed result sets to %s kwic lines", total)
+
+    def _purge(self) -> None:
+        for id in [id for id, rs in self._entries.items() if rs.is_expired]:
+            del self._entries[id]
+        while len(self._entries) >= self.max_entries:
+            oldest = min(self._entries.values(), key=lambda rs: rs.expires)
+            LOGGER.debug("Evicting result set %s", oldest.id)
+            del self._entries[oldest.id]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# ---------------------------------------------------------------------------
@@ -0,0 +1,104 @@
+"""
+Serialized startup snapshots to speed up worker cold starts.
+
+Parsed configuration objects (e.g. the `EndpointDescription`) and the Korp
+corpus info are pickled to a cache directory, so later workers can skip
+parsing and network roundtrips during initialization.
+"""
+
+import logging
+import os
+import pickle
+import tempfile
+import time
+from typing import Any
+from typing import Hashable
+from typing import Optional
+
+# ---------------------------------------------------------------------------
+
+
+LOGGER = logging.getLogger(__name__)
+
+SNAPSHOT_SUFFIX = ".pickle"
+
+
+# ---------------------------------------------------------------------------
+
+
+def file_key(filename: str) -> Hashable:
+    """Build a cache key that changes whenever the file is modified.
+
+    Args:
+        filename: path to the source file
+
+    Returns:
+        Hashable: the cache key (path, size and modification time)
+    """
+    stat = os.stat(filename)
+    return (os.path.abspath(filename), stat.st_size, stat.st_mtime_ns)
+
+
+def load_snapshot(
+    cache_dir: str, name: str, key: Hashable, max_age: Optional[float] = None
+) -> Optional[Any]:
+    """Load a snapshot if it exists, is valid for ``key`` and not expired.
+
+    Args:
+        cache_dir: the snapshot directory
+        name: the snapshot name
+        key: the cache key the snapshot was stored with
+        max_age: maximum age in seconds, ``None`` to never expire
+
+    Returns:
+        Any: the snapshot value or ``None`` if missing, stale or invalid
+    """
+    filename = os.path.join(cache_dir, f"{name}{SNAPSHOT_SUFFIX}")
+    try:
+        with open(filename, "rb") as fp:
+            data = pickle.load(fp)
+    except FileNotFoundError:
+        LOGGER.debug("No snapshot '%s' found", name)
+        return None
+    except Exception as ex:
+        LOGGER.warning("Could not load snapshot '%s': %s", name, ex)
+        return None
+
+    if not isinstance(data, dict) or data.get("key") != key:
+        LOGGER.debug("Snapshot '%s' is outdated", name)
+        return None
+    if max_age is not None and time.time() - data.get("created", 0) > max_age:
+        LOGGER.debug("Snapshot '%s' is expired", name)
+        return None
+
+    LOGGER.debug("Using snapshot '%s'", name)
+    return data.get("value")
+
+
+def store_snapshot(cache_dir: str, name: str, key: Hashable, value: Any) -> None:
+    """Store a snapshot. The file is replaced atomically, so concurrently
+    starting workers will never read partially written snapshots.
+
+    Args:
+        cache_dir: the snapshot directory
+        name: the snapshot name
+        key: the cache key to validate the snapshot when loading
+        value: the (picklable) value to store
+    """
+    filename = os.path.join(cache_dir, f"{name}{SNAPSHOT_SUFFIX}")
+    data = {"key": key, "created": time.time(), "value": value}
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmpname = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                pickle.dump(data, fp, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmpname, filename)
+        except BaseException:
+            os.unlink(tmpname)
+            raise
+    except Exception as ex:
+        LOGGER.warning("Could not store snapshot '%s': %s", name, ex)
+
+
+# ---------------------------------------------------------------------------
@@ -0,0 +1,219 @@
+"""
+Latency-aware routing across multiple Korp API mirrors.
+
+Each upstream keeps an exponentially weighted moving average (EWMA) of
+its latency and error rate, observed from regular requests (passive health
+checks). Requests go to the upstream with the lowest expected cost,
+optionally preferring a stable upstream per corpus selection (affinity).
+Upstreams that fail repeatedly are taken out of rotation for a cooldown
+period and then restored after a successful trial request.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict
+from typing import List
+from typing import Optional
+from typing import Sequence
+
+# ---------------------------------------------------------------------------
+
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = 20.0
+"""Request timeout in seconds, below the default gunicorn worker timeout"""
+
+
+# ---------------------------------------------------------------------------
+
+
+@dataclass(eq=False)
+class Upstream:
+    url: str
+    latency: Optional[float] = None
+    """EWMA of the response time in seconds, ``None`` if never used"""
+    error_rate: float = 0.0
+    """EWMA of failures (``0.0`` - ``1.0``)"""
+    failures: int = 0
+    """Number of consecutive failures"""
+    down_until: float = 0.0
+    """Monotonic time until which the upstream is out of rotation"""
+    inflight: int = 0
+    requests: int = 0
+
+    def is_down(self, now: float) -> bool:
+        return self.down_until > now
+
+    def cost(self, default_latency: float) -> float:
+        latency = self.latency if self.latency is not None else default_latency
+        # queue behind concurrent requests, retry on errors
+        return latency * (1 + self.inflight) / max(0.05, 1.0 - self.error_rate)
+
+
+class UpstreamPool:
+    """Thread-safe selection of Korp API base URLs."""
+
+    def __init__(
+        self,
+        urls: Sequence[str],
+        alpha: float = 0.3,
+        max_failures: int = 3,
+        cooldown: float = 30.0,
+        affinity: bool = False,
+        affinity_slack: float = 1.5,
+        timeout: Optional[float] = DEFAULT_TIMEOUT,
+        max_attempts: int = 2,
+    ) -> None:
+        """[Constructor]
+
+        Args:
+            urls: the Korp API base URLs
+            alpha: smoothing factor for latency and error rate
+            max_failures: consecutive failures before an upstream is
+                taken out of rotation
+            cooldown: seconds before a failed upstream is tried again
+            affinity: prefer the same upstream for the same corpora
+            affinity_slack: the preferred upstream is only used if its
+                cost is at most this factor above the best upstream
+            timeout: request timeout in seconds (connect and read),
+                ``None`` to wait forever
+            max_attempts: number of upstreams to try for a request that
+                fails with a connection error or server error
+        """
+        if not urls:
+            raise ValueError("No upstream URLs")
+        self.upstreams = [Upstream(url) for url in urls]
+        self.alpha = alpha
+        self.max_failures = max(1, max_failures)
+        self.cooldown = cooldown
+        self.affinity = affinity
+        self.affinity_slack = max(1.0, affinity_slack)
+        self.timeout = timeout
+        self.max_attempts = max(1, min(max_attempts, len(self.upstreams)))
+        self._lock = threading.Lock()
+
+    @property
+    def urls(self) -> List[str]:
+        return [upstream.url for upstream in self.upstreams]
+
+    def __repr__(self) -> str:
+        return f"UpstreamPool({self.urls!r})"
+
+    def choose(
+        self, key: Optional[str] = None, exclude: Sequence[Upstream] = ()
+    ) -> Upstream:
+        """Choose an upstream for a request and mark it as in use. Must be
+        followed by a call to `report`.
+
+        Args:
+            key: affinity key, e.g. the queried corpora
+            exclude: upstreams that should not be used (already failed
+                for this request), unless there are no others
+
+        Returns:
+            Upstream: the upstream to use
+        """
+        with self._lock:
+            now = time.monotonic()
+            candidates = [
+                u for u in self.upstreams if not u.is_down(now) and u not in exclude
+            ]
+            if not candidates:
+                # all down: try the one that will be restored first
+                candidates = [
+                    min(
+                        (u for u in self.upstreams if u not in exclude),
+                        key=lambda u: u.down_until,
+                        default=min(self.upstreams, key=lambda u: u.down_until),
+                    )
+                ]
+
+            known = [u.latency for u in self.upstreams if u.latency is not None]
+            # unknown upstreams look slightly better than average, to get a sample
+            default_latency = 0.9 * sum(known) / len(known) if known else 0.0
+            costs = {u.url: u.cost(default_latency) for u in candidates}
+            best = min(candidates, key=lambda u: costs[u.url])
+
+            if self.affinity and key is not None and len(candidates) > 1:
+                limit = costs[best.url] * self.affinity_slack
+                preferred = max(
+                    (u for u in candidates if costs[u.url] <= limit),
+                    key=lambda u: _rendezvous_hash(key, u.url),
+                )
+                best = preferred
+
+            best.inflight += 1
+            best.requests += 1
+            # half-open: one trial request, further requests wait for the result
+            if best.down_until and not best.is_down(now):
+                best.down_until = now + self.cooldown
+            return best
+
+    def report(self, upstream: Upstream, latency: float, ok: bool) -> None:
+        """Record the outcome of a request.
+
+        Args:
+            upstream: the upstream chosen with `choose`
+            latency: the response time in seconds
+            ok: whether the upstream responded properly
+        """
+        with self._lock:
+            upstream.inflight = max(0, upstream.inflight - 1)
+            error = 0.0 if ok else 1.0
+            upstream.error_rate += self.alpha * (error - upstream.error_rate)
+
+            if ok:
+                if upstream.latency is None:
+                    upstream.latency = latency
+                else:
+                    upstream.latency += self.alpha * (latency - upstream.latency)
+                if upstream.down_until:
+                    LOGGER.warning("Upstream %s restored", upstream.url)
+                    # start over, else the error rate would keep it unused
+                    upstream.error_rate = 0.0
+                upstream.failures = 0
+                upstream.down_until = 0.0
+                return
+
+            upstream.failures += 1
+            if upstream.failures >= self.max_failures:
+                if not upstream.down_until:
+                    LOGGER.warning(
+                        "Upstream %s failed %s times, out of rotation for %ss",
+                        upstream.url,
+                        upstream.failures,
+                        self.cooldown,
+                    )
+                upstream.down_until = time.monotonic() + self.cooldown
+
+    def status(self) -> Dict[str, Dict[str, object]]:
+        """Get a snapshot of the upstream statistics (for logging)."""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                u.url: {
+                    "latency": u.latency,
+                    "error_rate": round(u.error_rate, 3),
+                    "down": u.is_down(now),
+                    "inflight": u.inflight,
+                    "requests": u.requests,
+                }
+                for u in self.upstreams
+            }
+
+
+def _rendezvous_hash(key: str, url: str) -> int:
+    digest = hashlib.blake2b(f"{key}\0{url}".encode("utf-8"), digest_size=8)
+    return int.from_bytes(digest.digest(), "big")
+
+
+def parse_upstream_urls(value: str) -> List[str]:
+    """Split a comma or whitespace separated list of base URLs."""
+    return [url for url in value.replace(",", " ").split() if url]
+
+
+# ---------------------------------------------------------------------------
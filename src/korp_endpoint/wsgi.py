@@ -0,0 +1,319 @@
+"""
+WSGI application for the Korp endpoint.
+
+Extends the `SRUServerApp` with response caching for ``explain``,
+response compression, optional request profiling and a batch search
+route.
+"""
+
+import hashlib
+import json
+import logging
+import threading
+import typing
+from dataclasses import dataclass
+from datetime import datetime
+from datetime import timezone
+from typing import Hashable
+from typing import Iterable
+from typing import List
+from typing import Optional
+from typing import Tuple
+
+from clarin.sru.constants import SRUParam
+from clarin.sru.exception import SRUConfigException
+from clarin.sru.fcs.constants import X_FCS_ENDPOINT_DESCRIPTION
+from clarin.sru.server.wsgi import SRUServerApp
+from werkzeug import Request
+from werkzeug import Response
+
+from korp_endpoint.batch import BatchSearch
+from korp_endpoint.batch import dump_ndjson
+from korp_endpoint.batch import parse_batch
+from korp_endpoint.compression import CompressionMiddleware
+from korp_endpoint.profiling import RequestProfiler
+
+if typing.TYPE_CHECKING:
+    from _typeshed.wsgi import StartResponse
+    from _typeshed.wsgi import WSGIEnvironment
+
+
+# ---------------------------------------------------------------------------
+
+
+LOGGER = logging.getLogger(__name__)
+
+COMPRESSION_LEVEL_KEY = "se.gu.spraakbanken.fcs.korp.sru.compressionLevel"
+COMPRESSION_MIN_SIZE_KEY = "se.gu.spraakbanken.fcs.korp.sru.compressionMinSize"
+PROFILE_DIR_KEY = "se.gu.spraakbanken.fcs.korp.sru.profileDir"
+PROFILE_TOKEN_KEY = "se.gu.spraakbanken.fcs.korp.sru.profileToken"
+PROFILE_SAMPLE_RATE_KEY = "se.gu.spraakbanken.fcs.korp.sru.profileSampleRate"
+BATCH_MAX_QUERIES_KEY = "se.gu.spraakbanken.fcs.korp.sru.batchMaxQueries"
+BATCH_MAX_WORKERS_KEY = "se.gu.spraakbanken.fcs.korp.sru.batchMaxWorkers"
+
+BATCH_PATH = "/batch"
+"""Route for batch searches (``POST``, JSON list of queries)"""
+
+X_PROFILE = "X-Korp-Profile"
+"""Request header to request profiling, value must match the token (a header,
+so the token does not end up in access logs)"""
+
+
+# ---------------------------------------------------------------------------
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    version: Hashable
+    """The `KorpEndpointSearchEngine.get_explain_version` it was rendered for"""
+    status: int
+    headers: List[Tuple[str, str]]
+    body: bytes
+    etag: str
+    last_modified: datetime
+
+
+class ExplainCache:
+    """Caches rendered ``explain`` responses, one for each combination of
+    SRU version, indentation and endpoint description flag.
+
+    Requests with any other parameter are not cached (they might result
+    in diagnostics or echoed content).
+    """
+
+    CACHEABLE_PARAMS = frozenset(
+        (
+            SRUParam.OPERATION.value,
+            SRUParam.VERSION.value,
+            SRUParam.X_INDENT_RESPONSE.value,
+            X_FCS_ENDPOINT_DESCRIPTION,
+        )
+    )
+
+    def __init__(self, max_entries: int = 64) -> None:
+        self.max_entries = max_entries
+        self._entries: typing.Dict[Hashable, CachedResponse] = {}
+        self._lock = threading.Lock()
+
+    def get_key(self, request: Request) -> Optional[Hashable]:
+        if request.method not in ("GET", "HEAD"):
+            return None
+        args = request.args
+        if args.get(SRUParam.OPERATION.value, "explain") != "explain":
+            return None
+        if not self.CACHEABLE_PARAMS.issuperset(args.keys()):
+            return None
+        if any(len(values) > 1 for values in args.listvalues()):
+            return None
+        return (request.path,) + tuple(
+            args.get(name) for name in sorted(self.CACHEABLE_PARAMS)
+        )
+
+    def get(self, key: Hashable, version: Hashable) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None or entry.version != version:
+            return None
+        return entry
+
+    def put(self, key: Hashable, version: Hashable, response: Response) -> None:
+        body = response.get_data()
+        entry = CachedResponse(
+            version=version,
+            status=response.status_code,
+            headers=[
+                (name, value)
+                for name, value in response.headers.items()
+                if name.lower() != "content-length"
+            ],
+            body=body,
+            etag=hashlib.sha1(body).hexdigest(),
+            last_modified=datetime.now(timezone.utc).replace(microsecond=0),
+        )
+        with self._lock:
+            # drop outdated entries, e.g. after the endpoint description changed
+            for other_key in [
+                k for k, v in self._entries.items() if v.version != version
+            ]:
+                del self._entries[other_key]
+            if key in self._entries or len(self._entries) < self.max_entries:
+                self._entries[key] = entry
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+# ---------------------------------------------------------------------------
+
+
+class KorpSRUServerApp(SRUServerApp):
+    """SRU server WSGI application with pre-rendered ``explain``
+    responses. The cached responses are served with ``ETag`` and
+    ``Last-Modified`` headers, conditional requests are answered with
+    ``304 Not Modified``.
+
+    Responses are compressed with ``gzip``/``deflate`` if the client
+    accepts it (see `CompressionMiddleware`), unless `COMPRESSION_LEVEL_KEY`
+    is set to ``0``. Requests can optionally be profiled (see `RequestProfiler`), if
+    `PROFILE_DIR_KEY` is configured.
+
+    ``POST`` requests to `BATCH_PATH` run many queries at once (see
+    `BatchSearch`), unless `BATCH_MAX_QUERIES_KEY` is set to ``0``.
+    """
+
+    def init(self) -> None:
+        super().init()
+        self.explain_cache = ExplainCache()
+        self.profiler = self._create_profiler()
+        self.compression = self._create_compression()
+        self.batch = self._create_batch()
+
+    def _create_compression(self) -> Optional[CompressionMiddleware]:
+        level = self.params.get(COMPRESSION_LEVEL_KEY)
+        min_size = self.params.get(COMPRESSION_MIN_SIZE_KEY)
+        try:
+            level = 6 if level is None or level == "" else int(level)
+            min_size = 1024 if min_size is None or min_size == "" else int(min_size)
+            if level == 0:
+                LOGGER.info("Response compression disabled")
+                return None
+            return CompressionMiddleware(self.wsgi_app, level=level, min_size=min_size)
+        except ValueError as ex:
+            raise SRUConfigException(f"invalid compression setting: {ex}") from ex
+
+    def _create_batch(self) -> Optional[BatchSearch]:
+        if getattr(self.search_engine, "run_query", None) is None:
+            return None
+        try:
+            max_queries = int(self.params.get(BATCH_MAX_QUERIES_KEY) or 100)
+            max_workers = int(self.params.get(BATCH_MAX_WORKERS_KEY) or 4)
+        except ValueError as ex:
+            raise SRUConfigException(f"invalid batch setting: {ex}") from ex
+        if max_queries <= 0:
+            LOGGER.info("Batch search disabled")
+            return None
+        config = self.server.config
+        return BatchSearch(
+            self.search_engine,
+            number_of_records=config.number_of_records,
+            maximum_records=config.maximum_records,
+            max_queries=max_queries,
+            max_workers=max_workers,
+        )
+
+    def _create_profiler(self) -> Optional[RequestProfiler]:
+        output_dir = self.params.get(PROFILE_DIR_KEY)
+        if not output_dir or output_dir.isspace():
+            return None
+
+        token = self.params.get(PROFILE_TOKEN_KEY) or None
+        try:
+            sample_rate = float(self.params.get(PROFILE_SAMPLE_RATE_KEY) or 0.0)
+        except ValueError as ex:
+            raise SRUConfigException(f"invalid profile sample rate: {ex}") from ex
+        if not token and sample_rate <= 0:
+            LOGGER.warning("Profile directory set, but no token or sample rate")
+            return None
+
+        LOGGER.info("Request profiling enabled (sample rate: %s)", sample_rate)
+        return RequestProfiler(output_dir, token=token, sample_rate=sample_rate)
+
+    def _get_explain_version(self) -> Optional[Hashable]:
+        get_version = getattr(self.search_engine, "get_explain_version", None)
+        if get_version is None:
+            return None
+        return get_version()
+
+    def handle_explain(self, request: Request) -> Optional[Response]:
+        key = self.explain_cache.get_key(request)
+        if key is None:
+            return None
+        version = self._get_explain_version()
+        if version is None:
+            return None
+
+        entry = self.explain_cache.get(key, version)
+        if entry is None:
+            LOGGER.debug("Rendering explain response for %s", key)
+            response = Response()
+            self.server.handle_request(request, response)
+            if response.status_code != 200:
+                return response
+            self.explain_cache.put(key, version, response)
+            entry = self.explain_cache.get(key, version)
+            if entry is None:
+                return response
+
+        response = Response(entry.body, status=entry.status, headers=entry.headers)
+        response.set_etag(entry.etag)
+        response.last_modified = entry.last_modified
+        return response.make_conditional(request)
+
+    # ----------------------------------------------------
+
+    def wsgi_app(
+        self, environ: "WSGIEnvironment", start_response: "StartResponse"
+    ) -> Iterable[bytes]:
+        request = Request(environ)
+
+        if self.profiler is not None:
+            with self.profiler.track():
+                trace_memory = self.profiler.check(request.headers.get(X_PROFILE))
+                if trace_memory is None:
+                    response = self.handle_request(request)
+                    return response(environ, start_response)
+                name = request.path
+                if request.query_string:
+                    name = f"{name}?{request.query_string.decode('latin-1')}"
+                with self.profiler.profile(name, trace_memory):
+                    response = self.handle_request(request)
+                return response(environ, start_response)
+
+        response = self.handle_request(request)
+        return response(environ, start_response)
+
+    def __call__(
+        self, environ: "WSGIEnvironment", start_response: "StartResponse"
+    ) -> Iterable[bytes]:
+        if self.compression is not None:
+            return self.compression(environ, start_response)
+        return self.wsgi_app(environ, start_response)
+
+    def handle_batch(self, request: Request) -> Response:
+        assert self.batch is not None
+        if request.method != "POST":
+            response = _json_error(405, "Batch search requires POST")
+            response.allow.add("POST")
+            return response
+        try:
+            queries = parse_batch(json.loads(request.get_data()))
+        except ValueError as ex:
+            return _json_error(400, str(ex))
+        if len(queries) > self.batch.max_queries:
+            return _json_error(
+                413, f"Too many queries, at most {self.batch.max_queries} allowed"
+            )
+        return Response(
+            dump_ndjson(self.batch.run(queries)), mimetype="application/x-ndjson"
+        )
+
+    def handle_request(self, request: Request) -> Response:
+        if self.batch is not None and request.path == BATCH_PATH:
+            return self.handle_batch(request)
+        response = self.handle_explain(request)
+        if response is None:
+            response = Response()
+            self.server.handle_request(request, response)
+        return response
+
+
+# ---------------------------------------------------------------------------
+
+
+def _json_error(status: int, message: str) -> Response:
+    return Response(
+        json.dumps({"error": message}), status=status, mimetype="application/json"
+    )
+
+
+# ---------------------------------------------------------------------------
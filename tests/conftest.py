@@ -0,0 +1,35 @@
+import logging
+import os
+import sys
+
+import pytest
+
+# the local Korp stand-in of the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from korp_stub import KorpStubServer  # noqa: E402
+
+# ---------------------------------------------------------------------------
+
+
+@pytest.fixture
+def korp_server():
+    server = KorpStubServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def make_test_app(korp_server, caplog):
+    from korp_endpoint.app import make_app
+    from korp_endpoint.endpoint import API_BASE_URL_KEY
+
+    caplog.set_level(logging.WARNING)
+
+    def _make_app(**params):
+        return make_app({API_BASE_URL_KEY: korp_server.api_base_url, **params})
+
+    return _make_app
+
+
+# ---------------------------------------------------------------------------
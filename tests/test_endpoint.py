@@ -0,0 +1,26 @@
+import json
+
+from korp_endpoint import korp
+from korp_endpoint.endpoint import JSON_DECODER_KEY
+
+# ---------------------------------------------------------------------------
+
+
+def test_init_keeps_custom_json_decoder(make_test_app, monkeypatch):
+    monkeypatch.setattr(korp, "_json_decoder", None)
+    calls = []
+
+    def decoder(data):
+        calls.append(len(data))
+        return json.loads(data)
+
+    korp.set_json_decoder(decoder)
+    make_test_app()
+    assert korp.get_json_decoder() is decoder
+    assert calls
+
+    make_test_app(**{JSON_DECODER_KEY: "json"})
+    assert korp.get_json_decoder() is not decoder
+
+
+# ---------------------------------------------------------------------------
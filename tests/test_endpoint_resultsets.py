@@ -0,0 +1,44 @@
+import re
+from urllib.parse import quote
+
+from werkzeug.test import Client
+
+from korp_endpoint.endpoint import X_RESULTSET_ID
+from korp_endpoint.resultsets import ResultSetCache
+
+# ---------------------------------------------------------------------------
+
+
+RESULTSET_ID = re.compile(rb"<sruResponse:resultSetId>([^<]+)<")
+
+
+def search(client: Client, query: str, **params) -> bytes:
+    args = "".join(f"&{k}={quote(str(v))}" for k, v in params.items())
+    resp = client.get(f"/?operation=searchRetrieve&query={quote(query)}{args}")
+    assert resp.status_code == 200
+    return resp.data
+
+
+def test_resultset_on_other_worker(make_test_app, korp_server):
+    # result sets are kept per worker process
+    first, second = Client(make_test_app()), Client(make_test_app())
+    data = search(first, "katten", maximumRecords=5)
+    rs_id = RESULTSET_ID.search(data).group(1).decode()
+    assert ResultSetCache.parse_handle(rs_id)[1] == ("cql", "katten")
+
+    data = search(second, f'cql.resultSetId="{rs_id}"', startRecord=6, maximumRecords=5)
+    assert data.count(b"<fcs:Resource ") == 5
+    assert RESULTSET_ID.search(data).group(1).decode() == rs_id
+    cqp = [p["cqp"][0] for p in korp_server.requests if "cqp" in p]
+    assert cqp[-1] == "[word = 'katten']"
+
+
+def test_unknown_resultset_runs_query(make_test_app):
+    client = Client(make_test_app())
+    data = search(client, "hund", maximumRecords=5, **{X_RESULTSET_ID: "deadbeef"})
+    assert data.count(b"<fcs:Resource ") == 5
+    rs_id = RESULTSET_ID.search(data).group(1).decode()
+    assert ResultSetCache.parse_handle(rs_id)[1] == ("cql", "hund")
+
+
+# ---------------------------------------------------------------------------
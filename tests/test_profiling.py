@@ -0,0 +1,58 @@
+import glob
+import os
+import threading
+
+from korp_endpoint.profiling import RequestProfiler
+
+# ---------------------------------------------------------------------------
+
+
+def read_summary(output_dir) -> str:
+    (filename,) = glob.glob(os.path.join(output_dir, "*.txt"))
+    with open(filename, encoding="utf-8") as fp:
+        return fp.read()
+
+
+# ---------------------------------------------------------------------------
+
+
+def test_trace_memory_with_idle_threads(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), token="secret")
+    # e.g. idle gthread workers or background fills
+    idle = threading.Event()
+    thread = threading.Thread(target=idle.wait)
+    thread.start()
+    try:
+        with profiler.track(), profiler.profile("/", trace_memory=True):
+            data = [bytearray(1024) for _ in range(100)]
+    finally:
+        idle.set()
+        thread.join()
+    assert data
+    summary = read_summary(tmp_path)
+    assert "peak traced memory" in summary
+    assert "memory tracing" not in summary
+    assert glob.glob(os.path.join(tmp_path, "*.alloc.folded"))
+
+
+def test_skip_memory_tracing_with_concurrent_requests(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), token="secret")
+    with profiler.track():
+        with profiler.track(), profiler.profile("/", trace_memory=True):
+            pass
+    summary = read_summary(tmp_path)
+    assert "memory tracing: skipped, 1 other requests were running" in summary
+    assert not glob.glob(os.path.join(tmp_path, "*.alloc.folded"))
+
+
+def test_note_requests_started_while_tracing(tmp_path):
+    profiler = RequestProfiler(str(tmp_path), token="secret")
+    with profiler.track(), profiler.profile("/", trace_memory=True):
+        with profiler.track():
+            pass
+    summary = read_summary(tmp_path)
+    assert "peak traced memory" in summary
+    assert "memory tracing: includes allocations of 1 requests" in summary
+
+
+# ---------------------------------------------------------------------------
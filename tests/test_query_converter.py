@@ -0,0 +1,127 @@
+import cql
+import pytest
+from clarin.sru.constants import SRUDiagnostics
+from clarin.sru.exception import SRUException
+from clarin.sru.fcs.constants import FCSDiagnostics
+from clarin.sru.queryparser import CQLQuery
+
+from korp_endpoint.query_converter import CQL_BOOLEAN_WITHIN
+from korp_endpoint.query_converter import MAX_CQL_AND_OPERANDS
+from korp_endpoint.query_converter import cql2cqp
+from korp_endpoint.query_converter import get_cql_within
+
+# ---------------------------------------------------------------------------
+
+
+def parse(query: str) -> CQLQuery:
+    return CQLQuery(query, cql.parse(query))
+
+
+def within_sentence(exclude: str, positive: str) -> str:
+    gap = f"[!({exclude})]*"
+    return f"<sentence> {gap} {positive} {gap} </sentence>"
+
+
+# ---------------------------------------------------------------------------
+
+
+def test_cql2cqp_term():
+    assert cql2cqp(parse("katten")) == "[word = 'katten']"
+    assert cql2cqp(parse('"den katten"')) == "[word = 'den'][word = 'katten']"
+
+
+def test_cql2cqp_or():
+    assert cql2cqp(parse("a or b")) == "([word = 'a'] | [word = 'b'])"
+    assert cql2cqp(parse("a OR b or c")) == (
+        "(([word = 'a'] | [word = 'b']) | [word = 'c'])"
+    )
+
+
+def test_cql2cqp_and():
+    assert cql2cqp(parse("a and b")) == (
+        "([word = 'a'] []* [word = 'b'] | [word = 'b'] []* [word = 'a'])"
+    )
+
+
+def test_cql2cqp_and_all_orders():
+    operands = ["a", "b", "c", "d"]
+    assert len(operands) == MAX_CQL_AND_OPERANDS
+    cqp = cql2cqp(parse(" and ".join(operands)))
+    # 4! orders of the operands
+    assert cqp.count(" | ") == 23
+    assert "[word = 'd'] []* [word = 'c'] []* [word = 'b'] []* [word = 'a']" in cqp
+
+
+def test_cql2cqp_and_deduplicates_operands():
+    assert cql2cqp(parse("a and a")) == "[word = 'a']"
+    assert cql2cqp(parse("a and b and a")) == (
+        "([word = 'a'] []* [word = 'b'] | [word = 'b'] []* [word = 'a'])"
+    )
+    # duplicates do not count towards the limit
+    cql2cqp(parse("a and b and c and d and a"))
+
+
+def test_cql2cqp_and_too_many_operands():
+    with pytest.raises(SRUException) as exc_info:
+        cql2cqp(parse("a and b and c and d and e"))
+    assert (
+        exc_info.value.uri
+        == FCSDiagnostics.GENERAL_QUERY_TOO_COMPLEX_CANNOT_PERFORM_QUERY
+    )
+
+
+def test_cql2cqp_not():
+    assert cql2cqp(parse("a not b")) == within_sentence(
+        "word = 'b'", "[word = 'a' & !(word = 'b')]"
+    )
+
+
+def test_cql2cqp_not_or():
+    exclude = "word = 'b' | word = 'c'"
+    expected = within_sentence(exclude, f"[word = 'a' & !({exclude})]")
+    assert cql2cqp(parse("a not (b or c)")) == expected
+    # chained NOT excludes all of them
+    assert cql2cqp(parse("a not b not c")) == expected
+
+
+def test_cql2cqp_not_and():
+    exclude = "word = 'c'"
+    assert cql2cqp(parse("(a and b) not c")) == within_sentence(
+        exclude,
+        f"([word = 'a' & !({exclude})] [!({exclude})]* [word = 'b' & !({exclude})]"
+        f" | [word = 'b' & !({exclude})] [!({exclude})]* [word = 'a' & !({exclude})])",
+    )
+
+
+def test_cql2cqp_prox_unsupported():
+    with pytest.raises(SRUException) as exc_info:
+        cql2cqp(parse("a prox b"))
+    assert exc_info.value.uri == SRUDiagnostics.UNSUPPORTED_BOOLEAN_OPERATOR
+    assert str(exc_info.value) == "Unsupported Boolean operator: prox"
+
+
+def test_cql2cqp_nested_not_unsupported():
+    with pytest.raises(SRUException) as exc_info:
+        cql2cqp(parse("a and (b not c)"))
+    assert exc_info.value.uri == SRUDiagnostics.UNSUPPORTED_BOOLEAN_OPERATOR
+    assert str(exc_info.value) == (
+        "Endpoint only supports NOT on the top level of a query"
+    )
+
+
+@pytest.mark.parametrize("query", ['a not "b c"', "a not (b and c)"])
+def test_cql2cqp_not_multiple_words_unsupported(query):
+    with pytest.raises(SRUException) as exc_info:
+        cql2cqp(parse(query))
+    assert exc_info.value.uri == SRUDiagnostics.UNSUPPORTED_BOOLEAN_OPERATOR
+    assert str(exc_info.value) == "Endpoint only supports NOT with single words"
+
+
+def test_get_cql_within():
+    assert get_cql_within(parse("a")) is None
+    assert get_cql_within(parse('"a b"')) is None
+    assert get_cql_within(parse("a or b")) == CQL_BOOLEAN_WITHIN
+    assert get_cql_within(parse("a not b")) == CQL_BOOLEAN_WITHIN
+
+
+# ---------------------------------------------------------------------------
@@ -0,0 +1,140 @@
+import time
+
+from clarin.sru.constants import SRUResultCountPrecision
+
+from korp_endpoint.resultsets import ResultSet
+from korp_endpoint.resultsets import ResultSetCache
+
+# ---------------------------------------------------------------------------
+
+
+def kwic(start: int, count: int):
+    return [{"match": {"position": i}} for i in range(start, start + count)]
+
+
+def make_rs(**kwargs) -> ResultSet:
+    return ResultSet(
+        id="rs", query="[word = 'a']", corpora=("A",), show=(), ttl=60, **kwargs
+    )
+
+
+# ---------------------------------------------------------------------------
+
+
+def test_get_kwic_unknown_hits():
+    rs = make_rs()
+    rs.windows[0] = kwic(0, 10)
+    assert rs.get_kwic(0, 5) is None
+
+
+def test_update_and_get_kwic():
+    rs = make_rs(precision=SRUResultCountPrecision.ESTIMATE)
+    rs.update({"hits": 25, "kwic": kwic(10, 10), "querydata": "abc"}, 10)
+    assert rs.hits == 25
+    assert rs.precision == SRUResultCountPrecision.EXACT
+    assert rs.query_data == "abc"
+    assert rs.get_kwic(12, 5) == kwic(12, 5)
+    # not (completely) fetched
+    assert rs.get_kwic(0, 5) is None
+    assert rs.get_kwic(15, 10) is None
+
+
+def test_get_kwic_last_page():
+    rs = make_rs()
+    rs.update({"hits": 25, "kwic": kwic(20, 5)}, 20)
+    # ends at the exact total
+    assert rs.get_kwic(20, 10) == kwic(20, 5)
+    # an estimate may be too low, the window must be complete
+    rs.precision = SRUResultCountPrecision.ESTIMATE
+    assert rs.get_kwic(20, 10) is None
+
+
+def test_update_keeps_query_data():
+    rs = make_rs()
+    rs.update({"hits": 5, "kwic": kwic(0, 5), "querydata": "abc"}, 0)
+    rs.update({"hits": 5, "kwic": []}, 5)
+    assert rs.query_data == "abc"
+    assert list(rs.windows) == [0]
+
+
+def test_set_segment_hits():
+    rs = make_rs(hits=12, precision=SRUResultCountPrecision.ESTIMATE)
+    rs.segments = [(("A", "B"), 10), (("C",), -1), (("D",), -1)]
+    rs.set_segment_hits(1, 3)
+    assert rs.segments[1] == (("C",), 3)
+    assert rs.hits == 12
+    assert rs.precision == SRUResultCountPrecision.ESTIMATE
+    rs.set_segment_hits(2, 0)
+    assert rs.hits == 13
+    assert rs.precision == SRUResultCountPrecision.EXACT
+
+
+def test_handle():
+    rs = make_rs(source=("cql", "katten: hund"))
+    id, source = ResultSetCache.parse_handle(rs.handle)
+    assert id == "rs"
+    assert source == ("cql", "katten: hund")
+    assert ResultSetCache.parse_handle("rs") == ("rs", None)
+    assert ResultSetCache.parse_handle("rs.!!") == ("rs", None)
+    assert make_rs().handle == "rs"
+
+
+# ---------------------------------------------------------------------------
+
+
+def test_cache_get_or_create():
+    cache = ResultSetCache()
+    rs = cache.get_or_create("[word = 'a']", ["B", "A"], show=("lemma",))
+    assert cache.get_or_create("[word = 'a']", ["A", "B"], show=("lemma",)) is rs
+    assert cache.get(rs.id) is rs
+    assert cache.get_or_create("[word = 'a']", ["A", "B"]) is not rs
+    assert cache.get_or_create("[word = 'a']", ["A", "B"], within="sentence") is not rs
+
+
+def test_cache_expiry():
+    cache = ResultSetCache(ttl=60)
+    rs = cache.get_or_create("[word = 'a']", ["A"])
+    rs.expires = time.monotonic() - 1
+    assert cache.get(rs.id) is None
+    assert len(cache) == 0
+
+
+def test_cache_max_entries():
+    cache = ResultSetCache(max_entries=2)
+    first = cache.get_or_create("[word = 'a']", ["A"])
+    first.expires -= 10  # least recently used
+    cache.get_or_create("[word = 'b']", ["A"])
+    cache.get_or_create("[word = 'c']", ["A"])
+    assert len(cache) == 2
+    assert cache.get(first.id) is None
+
+
+def test_trim_per_result_set():
+    cache = ResultSetCache(max_kwic=15)
+    rs = cache.get_or_create("[word = 'a']", ["A"])
+    for start in (0, 10, 20):
+        rs.update({"hits": 100, "kwic": kwic(start, 10)}, start)
+        cache.trim(rs)
+    assert list(rs.windows) == [20]
+
+
+def test_trim_total():
+    cache = ResultSetCache(max_kwic=100, max_total_kwic=25)
+    sets = []
+    for i in range(3):
+        rs = cache.get_or_create(f"[word = '{i}']", ["A"])
+        rs.expires += i  # later ones were used more recently
+        rs.update({"hits": 100, "kwic": kwic(0, 10)}, 0)
+        cache.trim(rs)
+        sets.append(rs)
+    assert [rs.kwic_count for rs in sets] == [0, 10, 10]
+
+    # the window that was just fetched is kept
+    big = sets[0]
+    big.update({"hits": 100, "kwic": kwic(0, 30)}, 0)
+    cache.trim(big)
+    assert big.kwic_count == 30
+    assert sum(rs.kwic_count for rs in sets) == 30
+
+
+# ---------------------------------------------------------------------------
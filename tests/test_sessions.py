@@ -0,0 +1,152 @@
+import json
+import os
+import random
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from werkzeug.test import Client
+
+from korp_endpoint import korp
+from korp_endpoint.endpoint import ADAPTIVE_CORPUS_ORDER_KEY
+from korp_endpoint.endpoint import RESOURCE_INVENTORY_URL_KEY
+from korp_endpoint.resultsets import ResultSetCache
+
+# ---------------------------------------------------------------------------
+
+
+WORDS = 20
+RECORDS = 10
+RESULTSET_ID = re.compile(rb"<sruResponse:resultSetId>([^<]+)<")
+
+
+def rs_id(handle: str) -> str:
+    return ResultSetCache.parse_handle(handle)[0]
+
+
+def session_in_thread():
+    with ThreadPoolExecutor(1) as executor:
+        return executor.submit(korp.get_session).result()
+
+
+# ---------------------------------------------------------------------------
+
+
+def test_session_per_thread():
+    session = korp.get_session()
+    assert korp.get_session() is session
+    other = session_in_thread()
+    assert other is not session
+    # one connection pool for all threads
+    adapter = korp._get_adapter()
+    for s in (session, other):
+        assert s.get_adapter("http://korp/") is adapter
+        assert s.get_adapter("https://korp/") is adapter
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+def test_fork_resets_sessions(make_test_app):
+    app = make_test_app()
+    parent_adapter = korp._get_adapter()
+    parent_session = korp.get_session()
+    pid = os.fork()
+    if pid == 0:
+        # a forked worker must not reuse the parent's connections
+        ok = korp._adapter is None and korp.get_session() is not parent_session
+        resp = Client(app).get("/?operation=searchRetrieve&query=ord1")
+        ok = ok and resp.status_code == 200 and korp._adapter is not parent_adapter
+        os._exit(0 if ok else 1)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+    assert korp._adapter is parent_adapter
+
+
+def test_concurrent_requests(make_test_app, korp_server, tmp_path):
+    korp_server.latency = 0.005
+    ed_file = str(tmp_path / "endpoint-description.xml")
+    shutil.copy(
+        os.path.join(os.path.dirname(korp.__file__), "endpoint-description.xml"),
+        ed_file,
+    )
+    app = make_test_app(
+        **{RESOURCE_INVENTORY_URL_KEY: ed_file, ADAPTIVE_CORPUS_ORDER_KEY: "true"}
+    )
+    engine = app.search_engine
+    corpora = list(engine.corporaInfo.keys())
+    expected_ids = {
+        f"ord{i}": ResultSetCache.make_id(f"[word = 'ord{i}']", corpora)
+        for i in range(WORDS)
+    }
+    errors = []
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def _fail(message: str) -> None:
+        with lock:
+            errors.append(message)
+
+    def _search(client: Client, rng: random.Random) -> None:
+        word = f"ord{rng.randrange(WORDS)}"
+        start = rng.choice((1, 1, 11, 21, 31))
+        resp = client.get(
+            f"/?operation=searchRetrieve&query={word}"
+            f"&startRecord={start}&maximumRecords={RECORDS}"
+        )
+        records = resp.data.count(b"<fcs:Resource ")
+        match = RESULTSET_ID.search(resp.data)
+        if resp.status_code != 200 or records != RECORDS:
+            _fail(f"search {word}@{start}: {resp.status_code}, {records} records")
+        elif match is None or rs_id(match.group(1).decode()) != expected_ids[word]:
+            _fail(f"search {word}@{start}: unexpected result set {match}")
+
+    def _explain(client: Client, rng: random.Random) -> None:
+        resp = client.get("/?operation=explain&x-fcs-endpoint-description=true")
+        if resp.status_code != 200 or not resp.headers.get("ETag"):
+            _fail(f"explain: {resp.status_code}")
+        elif b"<ed:EndpointDescription" not in resp.data:
+            _fail("explain: endpoint description missing")
+
+    def _batch(client: Client, rng: random.Random) -> None:
+        words = [f"ord{rng.randrange(WORDS)}" for _ in range(5)]
+        body = [{"query": w, "maximumRecords": RECORDS} for w in words]
+        resp = client.post("/batch", json=body)
+        lines = [json.loads(line) for line in resp.data.splitlines()]
+        if resp.status_code != 200 or len(lines) != len(words):
+            _fail(f"batch: {resp.status_code}, {len(lines)} lines")
+        for line in lines:
+            if len(line.get("records", ())) != RECORDS:
+                _fail(f"batch: {line.get('diagnostic')}")
+            elif rs_id(line["resultSetId"]) != expected_ids[line["query"]]:
+                _fail(f"batch: unexpected result set {line['resultSetId']}")
+
+    def _one(i: int) -> None:
+        rng = random.Random(i)
+        op = rng.choices((_search, _explain, _batch), weights=(8, 1, 1))[0]
+        try:
+            op(Client(app), rng)
+        except Exception as ex:
+            _fail(f"{op.__name__}: {ex!r}")
+
+    def _touch() -> None:
+        # endpoint description changes, reloaded by concurrent explains
+        while not stop.wait(0.05):
+            os.utime(ed_file)
+
+    toucher = threading.Thread(target=_touch, daemon=True)
+    toucher.start()
+    try:
+        with ThreadPoolExecutor(16) as executor:
+            list(executor.map(_one, range(200)))
+    finally:
+        stop.set()
+        toucher.join()
+    engine.wait_for_background_tasks()
+
+    assert errors == []
+    # explain must reflect the latest endpoint description version
+    assert engine.get_explain_version()[0] == engine.endpoint_description_key
+
+
+# ---------------------------------------------------------------------------
@@ -0,0 +1,177 @@
+import time
+
+import pytest
+from korp_stub import KorpStubServer
+
+from korp_endpoint.korp import make_query
+from korp_endpoint.upstreams import UpstreamPool
+
+# ---------------------------------------------------------------------------
+
+
+@pytest.fixture
+def stub_servers():
+    servers = []
+
+    def _start(**kwargs) -> KorpStubServer:
+        server = KorpStubServer(**kwargs).start()
+        servers.append(server)
+        return server
+
+    yield _start
+    for server in servers:
+        server.stop()
+
+
+def query(pool: UpstreamPool, corpora: str = "SUC3"):
+    return make_query("[word = 'a']", corpora, 1, 5, api_base_url=pool)
+
+
+def fail(pool: UpstreamPool, url: str, times: int) -> None:
+    for _ in range(times):
+        upstream = pool.choose(exclude=[u for u in pool.upstreams if u.url != url])
+        assert upstream.url == url
+        pool.report(upstream, 0.1, ok=False)
+
+
+# ---------------------------------------------------------------------------
+
+
+def test_choose_lowest_latency(stub_servers):
+    slow = stub_servers(latency=0.05)
+    fast = stub_servers(latency=0.0)
+    pool = UpstreamPool([slow.api_base_url, fast.api_base_url])
+    for _ in range(10):
+        assert query(pool) is not None
+    status = pool.status()
+    assert status[fast.api_base_url]["latency"] < status[slow.api_base_url]["latency"]
+    # both got a sample, then the faster one takes the traffic
+    assert len(slow.requests) >= 1
+    assert len(fast.requests) > len(slow.requests)
+    assert all(u.inflight == 0 for u in pool.upstreams)
+
+
+def test_cooldown_after_failures():
+    pool = UpstreamPool(["http://a/", "http://b/"], max_failures=3, cooldown=60)
+    a, b = pool.upstreams
+    fail(pool, a.url, 2)
+    assert not a.is_down(time.monotonic())
+    fail(pool, a.url, 1)
+    assert a.is_down(time.monotonic())
+    assert pool.status()[a.url]["down"]
+    for _ in range(5):
+        upstream = pool.choose()
+        assert upstream is b
+        pool.report(upstream, 0.1, ok=True)
+
+
+def test_all_down_tries_first_restored():
+    pool = UpstreamPool(["http://a/", "http://b/"], max_failures=1, cooldown=60)
+    a, b = pool.upstreams
+    fail(pool, a.url, 1)
+    fail(pool, b.url, 1)
+    a.down_until -= 10
+    upstream = pool.choose()
+    assert upstream is a
+    pool.report(upstream, 0.1, ok=False)
+
+
+def test_half_open_restore():
+    pool = UpstreamPool(["http://a/", "http://b/"], max_failures=1, cooldown=60)
+    a, b = pool.upstreams
+    fail(pool, a.url, 1)
+    # cooldown is over
+    a.down_until = time.monotonic() - 1
+    trial = pool.choose(exclude=[b])
+    assert trial is a
+    # only one trial request, until it reports back
+    assert a.is_down(time.monotonic())
+    assert pool.choose() is b
+    pool.report(b, 0.1, ok=True)
+
+    pool.report(trial, 0.1, ok=True)
+    assert not a.is_down(time.monotonic())
+    assert a.failures == 0
+    assert a.error_rate == 0.0
+
+
+def test_half_open_trial_fails():
+    pool = UpstreamPool(["http://a/", "http://b/"], max_failures=3, cooldown=60)
+    a, b = pool.upstreams
+    fail(pool, a.url, 3)
+    a.down_until = time.monotonic() - 1
+    trial = pool.choose(exclude=[b])
+    pool.report(trial, 0.1, ok=False)
+    # back into cooldown after a single failure
+    assert a.is_down(time.monotonic())
+
+
+def test_failover_to_next_mirror(stub_servers):
+    broken = stub_servers(error_rate=1.0)
+    working = stub_servers()
+    pool = UpstreamPool([broken.api_base_url, working.api_base_url], max_failures=1)
+    b, w = pool.upstreams
+    # the broken one looks faster, so it is tried first
+    b.latency, w.latency = 0.001, 0.01
+
+    result = query(pool)
+    assert result is not None and result["hits"] > 0
+    assert len(broken.requests) == 1
+    assert len(working.requests) == 1
+    assert b.is_down(time.monotonic())
+
+    # out of rotation
+    assert query(pool) is not None
+    assert query(pool) is not None
+    assert len(broken.requests) == 1
+    assert len(working.requests) == 3
+
+
+def test_failover_on_connection_error(stub_servers):
+    stopped = stub_servers()
+    working = stub_servers()
+    stopped.stop()
+    pool = UpstreamPool([stopped.api_base_url, working.api_base_url], timeout=2)
+    pool.upstreams[0].latency, pool.upstreams[1].latency = 0.001, 0.01
+
+    assert query(pool) is not None
+    assert pool.upstreams[0].failures == 1
+    assert len(working.requests) == 1
+
+
+def test_single_url_timeout(korp_server):
+    korp_server.latency = 0.5
+    result = make_query(
+        "[word = 'a']", "SUC3", 1, 5, api_base_url=korp_server.api_base_url, timeout=0.1
+    )
+    assert result is None
+
+
+def test_rendezvous_affinity():
+    urls = [f"http://mirror{i}/" for i in range(4)]
+    pool = UpstreamPool(urls, affinity=True)
+    for upstream in pool.upstreams:
+        upstream.latency = 0.1
+
+    chosen = {}
+    for key in (f"CORPUS{i}" for i in range(20)):
+        upstream = pool.choose(key)
+        pool.report(upstream, 0.1, ok=True)
+        chosen[key] = upstream.url
+        # same key, same mirror
+        for _ in range(3):
+            again = pool.choose(key)
+            pool.report(again, 0.1, ok=True)
+            assert again.url == chosen[key]
+    # keys are spread over the mirrors
+    assert len(set(chosen.values())) > 1
+
+    # a mirror that is much slower loses its keys
+    slow_url = chosen["CORPUS0"]
+    next(u for u in pool.upstreams if u.url == slow_url).latency = 1.0
+    upstream = pool.choose("CORPUS0")
+    pool.report(upstream, 0.1, ok=True)
+    assert upstream.url != slow_url
+
+
+# ---------------------------------------------------------------------------